@@ -1,4 +1,5 @@
 """DelineateIt wrapper for pygeoprocessing's watershed delineation routine."""
+import collections
 import logging
 import os
 import time
@@ -116,6 +117,11 @@ _WS_ID_OVERWRITE_WARNING = (
     'Layer {layer_name} of vector {vector_basename} already has a feature '
     'named "ws_id". Field values will be overwritten.')
 
+# The most memory, in bytes, to use for holding the stream raster when
+# snapping points.  Stream rasters that fit are read into memory once rather
+# than being read one window at a time.
+_MAX_IN_MEMORY_STREAM_BYTES = 2**29  # 512 MiB
+
 
 def execute(args):
     """DelineateIt: Watershed Delineation.
@@ -251,20 +257,11 @@ def execute(args):
         snap_distance = int(args['snap_distance'])
         flow_threshold = int(args['flow_threshold'])
 
-        out_nodata = 255
-        flow_accumulation_task.join()  # wait so we can read the nodata value
-        flow_accumulation_nodata = pygeoprocessing.get_raster_info(
-            file_registry['flow_accumulation'])['nodata']
         streams_task = graph.add_task(
-            pygeoprocessing.raster_calculator,
-            args=([(file_registry['flow_accumulation'], 1),
-                   (flow_accumulation_nodata, 'raw'),
-                   (out_nodata, 'raw'),
-                   (flow_threshold, 'raw')],
-                  _threshold_streams,
-                  file_registry['streams'],
-                  gdal.GDT_Byte,
-                  out_nodata),
+            _calculate_streams,
+            args=(file_registry['flow_accumulation'],
+                  flow_threshold,
+                  file_registry['streams']),
             target_path_list=[file_registry['streams']],
             dependent_task_list=[flow_accumulation_task],
             task_name='threshold_streams')
@@ -299,6 +296,34 @@ def execute(args):
     graph.join()
 
 
+def _calculate_streams(flow_accum_path, flow_threshold, target_streams_path):
+    """Threshold a flow accumulation raster into a streams raster.
+
+    The nodata value of the flow accumulation raster is read here, once it
+    exists, so that ``execute`` doesn't have to wait on flow accumulation
+    before adding the rest of its tasks to the graph.
+
+    Args:
+        flow_accum_path (string): The path to a flow accumulation raster.
+        flow_threshold (number): A numeric threshold over which a flow
+            accumulation pixel will be marked as a stream.
+        target_streams_path (string): The path to where the streams raster
+            will be written.
+
+    Returns:
+        ``None``
+
+    """
+    out_nodata = 255
+    flow_accum_info = pygeoprocessing.get_raster_info(flow_accum_path)
+    pygeoprocessing.raster_calculator(
+        [(flow_accum_path, 1),
+         (flow_accum_info['nodata'][0], 'raw'),
+         (out_nodata, 'raw'),
+         (flow_threshold, 'raw')],
+        _threshold_streams, target_streams_path, gdal.GDT_Byte, out_nodata)
+
+
 def _threshold_streams(flow_accum, src_nodata, out_nodata, threshold):
     """Identify stream pixels based on a user-defined threshold.
 
@@ -320,17 +345,21 @@ def _threshold_streams(flow_accum, src_nodata, out_nodata, threshold):
         A ``numpy.uint8`` array with values of 0, 1 or ``out_nodata``.
 
     """
-    out_matrix = numpy.empty(flow_accum.shape, dtype=numpy.uint8)
-    out_matrix[:] = out_nodata
-
-    valid_pixels = slice(None)
-    if src_nodata is not None:
-        valid_pixels = ~utils.array_equals_nodata(flow_accum, src_nodata)
-
-    over_threshold = flow_accum > threshold
-    out_matrix[valid_pixels & over_threshold] = 1
-    out_matrix[valid_pixels & ~over_threshold] = 0
-    return out_matrix
+    # GDAL reports nodata as a double, but the pixel values have the raster's
+    # own type.  Casting nodata to that type first lets the kernel use an
+    # exact comparison (e.g. float32(0.1) != 0.1).
+    if (src_nodata is not None and
+            numpy.issubdtype(flow_accum.dtype, numpy.floating)):
+        src_nodata = flow_accum.dtype.type(src_nodata)
+
+    # The nodata check, threshold and assignment all happen in a single pass
+    # over the block in compiled code, without any temporary masks.  The
+    # kernel reads float32 and float64 blocks as they are; other types are
+    # copied to float64 first.
+    if flow_accum.dtype not in (numpy.float32, numpy.float64):
+        flow_accum = flow_accum.astype(numpy.float64)
+    return delineateit_core.threshold_streams(
+        flow_accum, src_nodata, out_nodata, threshold)
 
 
 def preprocess_geometries(outlet_vector_path, dem_path, target_vector_path,
@@ -471,6 +500,62 @@ def preprocess_geometries(outlet_vector_path, dem_path, target_vector_path,
     target_vector = None
 
 
+def _read_stream_window(stream_band, block_cache, max_cached_blocks,
+                        x_left, y_top, x_right, y_bottom):
+    """Read a window of a stream raster by way of whole, cached blocks.
+
+    Nearby points often have overlapping search windows.  Reading the stream
+    raster one block at a time and keeping the blocks around means that
+    each block is usually only read and decompressed once.
+
+    Args:
+        stream_band (gdal.Band): The stream raster band to read from.
+        block_cache (collections.OrderedDict): Maps ``(block_row, block_col)``
+            to a ``numpy.uint8`` array where stream pixels are 1.  Modified
+            in place; the least recently used blocks are dropped first.
+        max_cached_blocks (int): The most blocks to keep in ``block_cache``.
+        x_left, y_top, x_right, y_bottom (int): The pixel bounds of the
+            window to read.  ``x_right`` and ``y_bottom`` are exclusive.
+
+    Returns:
+        A ``numpy.uint8`` array covering the window where stream pixels are 1
+        and all other pixels are 0.
+
+    """
+    block_xsize, block_ysize = stream_band.GetBlockSize()
+    window = numpy.empty((y_bottom - y_top, x_right - x_left),
+                         dtype=numpy.uint8)
+    for block_row in range(y_top // block_ysize,
+                           (y_bottom - 1) // block_ysize + 1):
+        block_top = block_row * block_ysize
+        for block_col in range(x_left // block_xsize,
+                               (x_right - 1) // block_xsize + 1):
+            block_left = block_col * block_xsize
+            key = (block_row, block_col)
+            if key in block_cache:
+                block_cache.move_to_end(key)
+            else:
+                block_cache[key] = (stream_band.ReadAsArray(
+                    block_left, block_top,
+                    min(block_xsize, stream_band.XSize - block_left),
+                    min(block_ysize, stream_band.YSize - block_top)) == 1
+                ).view(numpy.uint8)
+                if len(block_cache) > max_cached_blocks:
+                    block_cache.popitem(last=False)
+            block = block_cache[key]
+
+            # copy over the part of the block that overlaps the window
+            top = max(y_top, block_top)
+            bottom = min(y_bottom, block_top + block.shape[0])
+            left = max(x_left, block_left)
+            right = min(x_right, block_left + block.shape[1])
+            window[top - y_top:bottom - y_top,
+                   left - x_left:right - x_left] = block[
+                top - block_top:bottom - block_top,
+                left - block_left:right - block_left]
+    return window
+
+
 def snap_points_to_nearest_stream(points_vector_path, stream_raster_path,
                                   flow_accum_raster_path, snap_distance,
                                   snapped_points_vector_path):
@@ -518,24 +603,56 @@ def snap_points_to_nearest_stream(points_vector_path, stream_raster_path,
     flow_accum_raster = gdal.OpenEx(flow_accum_raster_path, gdal.OF_RASTER)
     flow_accum_band = flow_accum_raster.GetRasterBand(1)
 
+    # Read the whole stream raster once if it and the stream mask made from it
+    # fit in the memory budget.  Otherwise, a window around each point is
+    # assembled from blocks of the raster, which are read from disk as needed
+    # and cached up to the same budget.
+    stream_mask = None
+    pixel_bytes = gdal.GetDataTypeSize(stream_band.DataType) // 8
+    if n_cols * n_rows * (pixel_bytes + 1) <= _MAX_IN_MEMORY_STREAM_BYTES:
+        stream_mask = (stream_band.ReadAsArray() == 1).view(numpy.uint8)
+    else:
+        block_cache = collections.OrderedDict()
+        block_xsize, block_ysize = stream_band.GetBlockSize()
+        max_cached_blocks = max(
+            _MAX_IN_MEMORY_STREAM_BYTES // (block_xsize * block_ysize), 1)
+
+    # Offsets of every pixel in the search window from its center pixel,
+    # ordered by distance from the center so the search for the nearest
+    # stream pixel can stop early.  Squared distances are used because the
+    # nearest pixel by squared distance is also the nearest by euclidean
+    # distance.  Equally distant offsets are in row-major order.
+    snap_distance = int(snap_distance)
+    row_offsets, col_offsets = numpy.mgrid[
+        -snap_distance:snap_distance + 1,
+        -snap_distance:snap_distance + 1].reshape(2, -1).astype(numpy.intc)
+    squared_distances = row_offsets**2 + col_offsets**2
+    search_order = numpy.lexsort((col_offsets, row_offsets, squared_distances))
+    row_offsets = row_offsets[search_order]
+    col_offsets = col_offsets[search_order]
+    squared_distances = squared_distances[search_order]
+
     driver = gdal.GetDriverByName('GPKG')
     snapped_vector = driver.Create(snapped_points_vector_path, 0, 0, 0,
                                    gdal.GDT_Unknown)
     layer_name = os.path.splitext(
         os.path.basename(snapped_points_vector_path))[0]
+    # The spatial index is built once after all the points are written,
+    # rather than being updated as each point is added.
     snapped_layer = snapped_vector.CreateLayer(
-        layer_name, points_layer.GetSpatialRef(), points_layer.GetGeomType())
+        layer_name, points_layer.GetSpatialRef(), points_layer.GetGeomType(),
+        options=['SPATIAL_INDEX=NO'])
     snapped_layer.CreateFields(points_layer.schema)
     snapped_layer_defn = snapped_layer.GetLayerDefn()
 
-    snapped_layer.StartTransaction()
-    n_features = points_layer.GetFeatureCount()
-    last_time = time.time()
-    for index, point_feature in enumerate(points_layer, 1):
-        if time.time() - last_time > 5.0:
-            LOGGER.info('Snapped %s of %s points', index, n_features)
-            last_time = time.time()
-
+    # Sort out which features can be snapped and collect the coordinates of
+    # those points, so that they can all be converted to pixel indices at once.
+    # source_features holds each feature to write to the snapped layer with
+    # its position in the points layer, for progress logging, and the index
+    # of its coordinates, or None if it can't be snapped.
+    source_features = []
+    point_coords = []
+    for feature_index, point_feature in enumerate(points_layer, 1):
         source_geometry = point_feature.GetGeometryRef()
         geom_name = source_geometry.GetGeometryName()
         geom_count = source_geometry.GetGeometryCount()
@@ -556,86 +673,127 @@ def snap_points_to_nearest_stream(points_vector_path, stream_raster_path,
             LOGGER.warning(
                 f"FID {point_feature.GetFID()} ({geom_name}, n={geom_count}) "
                 "Geometry cannot be snapped.")
-            new_feature = ogr.Feature(snapped_layer.GetLayerDefn())
-            new_feature.SetGeometry(source_geometry)
-            for field_name, field_value in point_feature.items().items():
-                new_feature.SetField(field_name, field_value)
-            snapped_layer.CreateFeature(new_feature)
+            source_features.append((feature_index, point_feature, None))
             continue
 
-        point = shapely.wkb.loads(bytes(source_geometry.ExportToWkb()))
         if geom_name == 'MULTIPOINT':
             # We already checked (above) that there's only one component point
-            point = point.geoms[0]
+            source_geometry = source_geometry.GetGeometryRef(0)
+        source_features.append(
+            (feature_index, point_feature, len(point_coords)))
+        point_coords.append((source_geometry.GetX(), source_geometry.GetY()))
+
+    point_coords = numpy.array(
+        point_coords, dtype=numpy.float64).reshape(-1, 2)
+    x_indices = (point_coords[:, 0] - geotransform[0]) // geotransform[1]
+    y_indices = (point_coords[:, 1] - geotransform[3]) // geotransform[5]
+    in_bounds = ((x_indices >= 0) & (x_indices < n_cols) &
+                 (y_indices >= 0) & (y_indices < n_rows)).tolist()
+    x_indices = x_indices.astype(numpy.int64).tolist()
+    y_indices = y_indices.astype(numpy.int64).tolist()
+
+    # SetGeometry copies the geometry it's given, so one point geometry can
+    # be moved around and reused for every snapped point.
+    point_geometry = ogr.Geometry(ogr.wkbPoint)
+    snapped_layer.StartTransaction()
+    n_features = points_layer.GetFeatureCount()
+    last_time = time.time()
+    for feature_index, point_feature, point_index in source_features:
+        if time.time() - last_time > 5.0:
+            LOGGER.info('Snapped %s of %s points', feature_index, n_features)
+            last_time = time.time()
 
-        x_index = (point.x - geotransform[0]) // geotransform[1]
-        y_index = (point.y - geotransform[3]) // geotransform[5]
-        if (x_index < 0 or x_index > n_cols or
-                y_index < 0 or y_index > n_rows):
+        if point_index is None:
+            new_feature = ogr.Feature(snapped_layer_defn)
+            new_feature.SetFrom(point_feature)
+            snapped_layer.CreateFeature(new_feature)
+            continue
+
+        if not in_bounds[point_index]:
+            x_coord, y_coord = point_coords[point_index]
             LOGGER.warning(
                 'Encountered a point that was outside the bounds of the '
-                f'stream raster.  FID:{point_feature.GetFID()} at {point}')
+                f'stream raster.  FID:{point_feature.GetFID()} at '
+                f'({x_coord}, {y_coord})')
             continue
-
-        x_left = max(x_index - snap_distance, 0)
-        y_top = max(y_index - snap_distance, 0)
-        x_right = min(x_index + snap_distance, n_cols)
-        y_bottom = min(y_index + snap_distance, n_rows)
-
-        # snap to the nearest stream pixel out to the snap distance
-        stream_window = stream_band.ReadAsArray(
-            int(x_left), int(y_top), int(x_right - x_left),
-            int(y_bottom - y_top))
-        row_indexes, col_indexes = numpy.nonzero(
-            stream_window == 1)
-
-        # Find the closest stream pixel that meets the distance
-        # requirement. If there is a tie, snap to the stream pixel with
-        # a higher flow accumulation value.
-        if row_indexes.size > 0:  # there are streams within the snap distance
-            # Calculate euclidean distance from the point to each stream pixel
-            distance_array = numpy.hypot(
-                # distance along y axis from the point to each stream pixel
-                y_index - y_top - row_indexes,
-                # distance along x axis from the point to each stream pixel
-                x_index - x_left - col_indexes,
-                dtype=numpy.float32)
-
-            is_nearest = distance_array == distance_array.min()
-            # if > 1 stream pixel is nearest, break tie with flow accumulation
-            if is_nearest.sum() > 1:
-                flow_accum_array = flow_accum_band.ReadAsArray(
-                    int(x_left), int(y_top), int(x_right - x_left),
-                    int(y_bottom - y_top))
-                # weight by flow accum
-                is_nearest = is_nearest * flow_accum_array[row_indexes, col_indexes]
-
-            # 1d index of max value in flattened array
-            nearest_stream_index_1d = numpy.argmax(is_nearest)
-
-            # convert 1d index back to coordinates relative to window
-            nearest_stream_row = row_indexes[nearest_stream_index_1d]
-            nearest_stream_col = col_indexes[nearest_stream_index_1d]
-
-            offset_row = nearest_stream_row - (y_index - y_top)
-            offset_col = nearest_stream_col - (x_index - x_left)
-
-            y_index += offset_row
-            x_index += offset_col
-
-        point_geometry = ogr.Geometry(ogr.wkbPoint)
-        point_geometry.AddPoint(
-            geotransform[0] + (x_index + 0.5) * geotransform[1],
+        x_index = x_indices[point_index]
+        y_index = y_indices[point_index]
+
+        # A point that's already on a stream pixel is snapped to the center
+        # of that pixel without searching the window around it.
+        if stream_mask is not None:
+            on_stream = stream_mask[y_index, x_index]
+        else:
+            on_stream = _read_stream_window(
+                stream_band, block_cache, max_cached_blocks,
+                x_index, y_index, x_index + 1, y_index + 1)[0, 0]
+
+        if not on_stream:
+            # snap to the nearest stream pixel out to the snap distance
+            if stream_mask is not None:
+                window_mask = stream_mask
+                y_top, x_left = 0, 0
+            else:
+                x_left = max(x_index - snap_distance, 0)
+                y_top = max(y_index - snap_distance, 0)
+                x_right = min(x_index + snap_distance + 1, n_cols)
+                y_bottom = min(y_index + snap_distance + 1, n_rows)
+                window_mask = _read_stream_window(
+                    stream_band, block_cache, max_cached_blocks,
+                    x_left, y_top, x_right, y_bottom)
+
+            # Find the closest stream pixel that meets the distance
+            # requirement. If there is a tie, snap to the stream pixel with
+            # a higher flow accumulation value.
+            nearest_pixels = delineateit_core.find_nearest_stream_pixels(
+                window_mask, y_index - y_top, x_index - x_left,
+                row_offsets, col_offsets, squared_distances)
+            if nearest_pixels:  # there are streams within the snap distance
+                nearest_rows, nearest_cols = numpy.array(nearest_pixels).T
+                nearest_rows += y_top
+                nearest_cols += x_left
+                nearest_stream_index = 0
+                # if > 1 stream pixel is nearest, break tie with flow
+                # accumulation
+                if nearest_rows.size > 1:
+                    ties_top = nearest_rows.min()
+                    ties_left = nearest_cols.min()
+                    flow_accum_array = flow_accum_band.ReadAsArray(
+                        int(ties_left), int(ties_top),
+                        int(nearest_cols.max() - ties_left + 1),
+                        int(nearest_rows.max() - ties_top + 1))
+                    nearest_stream_index = numpy.argmax(flow_accum_array[
+                        nearest_rows - ties_top, nearest_cols - ties_left])
+
+                y_index = nearest_rows[nearest_stream_index]
+                x_index = nearest_cols[nearest_stream_index]
+
+        point_geometry.SetPoint_2D(
+            0, geotransform[0] + (x_index + 0.5) * geotransform[1],
             geotransform[3] + (y_index + 0.5) * geotransform[5])
 
-        # Get the output Layer's Feature Definition
+        # The snapped layer has the same fields as the points layer, so
+        # SetFrom can copy all the field values at once.
         snapped_point_feature = ogr.Feature(snapped_layer_defn)
-        for field_name, field_value in point_feature.items().items():
-            snapped_point_feature.SetField(field_name, field_value)
+        snapped_point_feature.SetFrom(point_feature)
         snapped_point_feature.SetGeometry(point_geometry)
 
         snapped_layer.CreateFeature(snapped_point_feature)
     snapped_layer.CommitTransaction()
+    # Names are quoted as SQL string literals, so double any single quotes.
+    index_result = snapped_vector.ExecuteSQL(
+        "SELECT CreateSpatialIndex('{}', '{}')".format(
+            layer_name.replace("'", "''"),
+            snapped_layer.GetGeometryColumn().replace("'", "''")))
+    index_created = False
+    if index_result is not None:
+        index_feature = index_result.GetNextFeature()
+        index_created = bool(
+            index_feature is not None and index_feature.GetField(0))
+        snapped_vector.ReleaseResultSet(index_result)
+    if not index_created:
+        LOGGER.warning('Could not create a spatial index on '
+                       f'{snapped_points_vector_path}')
     snapped_layer = None
     snapped_vector = None
 
@@ -5,6 +5,7 @@ cimport numpy
 cimport cython
 from libcpp.set cimport set as cset
 from libcpp.pair cimport pair as cpair
+from libc.math cimport isnan
 
 
 @cython.boundscheck(False)  # Deactivate bounds checking
@@ -107,3 +108,109 @@ cpdef cset[cpair[double, double]] calculate_pour_point_array(
     return pour_points
 
 
+@cython.boundscheck(False)  # Deactivate bounds checking
+@cython.wraparound(False)   # Deactivate negative indexing.
+cpdef threshold_streams(
+        const cython.floating[:, :] flow_accum_array,
+        src_nodata,
+        unsigned char out_nodata,
+        double threshold):
+    """
+    Classify flow accumulation pixels as stream or non-stream in one pass.
+
+    Args:
+        flow_accum_array (numpy.ndarray): a 2D ``float32`` or ``float64``
+            array of flow accumulation values.
+        src_nodata (float): the nodata value of the flow accumulation array,
+            or ``None`` if it has no nodata value. Pixels exactly equal to
+            this value are nodata. May be NaN.
+        out_nodata (int): the value to write where ``flow_accum_array`` is
+            nodata. Must fit in a ``uint8``, like the output array.
+        threshold (float): flow accumulation values greater than this are
+            marked as streams.
+
+    Returns:
+        A ``numpy.uint8`` array with the same shape as ``flow_accum_array``,
+        with values of 1 (stream), 0 (not a stream) or ``out_nodata``.
+    """
+    cdef int height = flow_accum_array.shape[0]
+    cdef int width = flow_accum_array.shape[1]
+    cdef int row, col
+    cdef double value
+
+    out_array = numpy.empty((height, width), dtype=numpy.uint8)
+    cdef unsigned char[:, :] out_view = out_array
+
+    cdef bint check_nodata = src_nodata is not None
+    cdef double nodata = 0
+    cdef bint nodata_is_nan = False
+    if check_nodata:
+        nodata = src_nodata
+        nodata_is_nan = isnan(nodata)
+
+    for row in range(height):
+        for col in range(width):
+            value = flow_accum_array[row, col]
+            if check_nodata and (
+                    value == nodata or (nodata_is_nan and isnan(value))):
+                out_view[row, col] = out_nodata
+            elif value > threshold:
+                out_view[row, col] = 1
+            else:
+                out_view[row, col] = 0
+
+    return out_array
+
+
+@cython.boundscheck(False)  # Deactivate bounds checking
+@cython.wraparound(False)   # Deactivate negative indexing.
+cpdef list find_nearest_stream_pixels(
+        const unsigned char[:, :] stream_mask,
+        int center_row,
+        int center_col,
+        int[:] row_offsets,
+        int[:] col_offsets,
+        int[:] squared_distances):
+    """
+    Find the stream pixels nearest to a pixel, searching outwards from it.
+
+    Offsets are visited in order and the search stops as soon as every
+    offset at the distance of the first stream pixel found has been checked,
+    so nearby streams are found without looking at the rest of the search
+    area.
+
+    Args:
+        stream_mask (numpy.ndarray): a 2D array where nonzero values are
+            stream pixels.
+        center_row (int): the row index of the pixel to search around.
+        center_col (int): the column index of the pixel to search around.
+        row_offsets (numpy.ndarray): 1D array of row offsets from the center
+            pixel to search, sorted by increasing distance from the center.
+        col_offsets (numpy.ndarray): 1D array of column offsets from the
+            center pixel, in the same order as ``row_offsets``.
+        squared_distances (numpy.ndarray): 1D array of the squared distance
+            of each offset from the center pixel. Must be sorted.
+
+    Returns:
+        list of (row, col) tuples of the stream pixels that are nearest to
+        the center pixel, in the order they appear in the offset arrays.
+        Empty if there are no stream pixels among the offsets.
+    """
+    cdef int height = stream_mask.shape[0]
+    cdef int width = stream_mask.shape[1]
+    cdef int i, row, col
+    cdef int nearest_distance = -1
+    cdef list nearest_pixels = []
+
+    for i in range(row_offsets.shape[0]):
+        if nearest_distance >= 0 and squared_distances[i] > nearest_distance:
+            break
+        row = center_row + row_offsets[i]
+        col = center_col + col_offsets[i]
+        if row < 0 or row >= height or col < 0 or col >= width:
+            continue
+        if stream_mask[row, col]:
+            nearest_distance = squared_distances[i]
+            nearest_pixels.append((row, col))
+
+    return nearest_pixels
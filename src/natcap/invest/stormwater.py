@@ -2,6 +2,7 @@
 import logging
 import math
 import os
+import time
 
 import numpy
 import pygeoprocessing
@@ -19,10 +20,14 @@ from .spec_utils import u
 
 LOGGER = logging.getLogger(__name__)
 
-# a constant nodata value to use for intermediates and outputs
+# a constant nodata value to use for intermediates and outputs. it's written
+# exactly by the model's own ops, so it's compared with == rather than isclose
 FLOAT_NODATA = -1
 UINT8_NODATA = 255
 UINT16_NODATA = 65535
+# the largest range of LULC codes to make a lookup array for. codes spread
+# out further than this are looked up by searching the sorted codes instead.
+_MAX_LUCODE_LOOKUP_SIZE = 2**24
 
 ARGS_SPEC = {
     "model_name": MODEL_METADATA["stormwater"].model_title,
@@ -263,15 +268,46 @@ def execute(args):
         target_path_list=align_outputs,
         task_name='align input rasters')
 
-    # Build a lookup dictionary mapping each LULC code to its row
-    biophysical_dict = utils.build_lookup_from_csv(
-        args['biophysical_table'], 'lucode')
-    # sort the LULC codes upfront because we use the sorted list in multiple
-    # places. it's more efficient to do this once.
-    sorted_lucodes = sorted(biophysical_dict)
-
-    # convert the nested dictionary in to a 2D array where rows are LULC codes
-    # in sorted order and columns correspond to soil groups in order
+    # Read the biophysical table into a dataframe with one row per LULC code,
+    # sorted by LULC code, so that each column can be taken as an array
+    # with rows in sorted LULC code order
+    # index_col=False keeps pandas from using the first column as the index
+    # when rows end with a trailing delimiter
+    biophysical_df = utils.read_csv_to_dataframe(
+        args['biophysical_table'], to_lower=True, index_col=False)
+    biophysical_df = utils.drop_blank_table_rows(
+        biophysical_df, args['biophysical_table'])
+    # every remaining row needs a lucode and a value for each ratio and EMC
+    # column, or NaNs would flow into the output rasters. is_connected may be
+    # left blank, which means not connected.
+    missing_lucode_mask = biophysical_df['lucode'].isna()
+    if missing_lucode_mask.any():
+        # the index is the row number, and rows start on line 2
+        missing_lines = biophysical_df.index[missing_lucode_mask] + 2
+        raise ValueError(
+            'The lucode column of the biophysical table is missing values on '
+            f'line(s) {missing_lines.tolist()}')
+    for column in biophysical_df.columns:
+        if column.startswith(('rc_', 'pe_', 'emc_')):
+            missing_mask = biophysical_df[column].isna()
+            if missing_mask.any():
+                raise ValueError(
+                    f'The {column} column of the biophysical table is '
+                    'missing values for lucode(s) '
+                    f'{biophysical_df["lucode"][missing_mask].tolist()}')
+    biophysical_df = biophysical_df.set_index('lucode').sort_index()
+    duplicate_lucodes = biophysical_df.index[
+        biophysical_df.index.duplicated()].unique().tolist()
+    if duplicate_lucodes:
+        raise ValueError(
+            'The lucode column of the biophysical table has duplicate '
+            f'values: {duplicate_lucodes}')
+    # array to look up each LULC code's row in the arrays built below. it's
+    # made once here and passed to every task that needs it.
+    lucode_lookup = make_lucode_lookup(biophysical_df.index.tolist())
+
+    # take the runoff coefficient columns as a 2D array where rows are LULC
+    # codes in sorted order and columns correspond to soil groups in order
     # this facilitates efficiently looking up the ratio values with numpy
     #
     # Biophysical table has runoff coefficents so subtract
@@ -279,11 +315,9 @@ def execute(args):
     # add a placeholder in column 0 so that the soil groups 1, 2, 3, 4 line
     # up with their indices in the array. this is more efficient than
     # decrementing the whole soil group array by 1.
-    retention_ratio_array = numpy.array([
-        [1 - biophysical_dict[lucode][f'rc_{soil_group}']
-            for soil_group in ['a', 'b', 'c', 'd']
-         ] for lucode in sorted_lucodes
-    ], dtype=numpy.float32)
+    retention_ratio_array = (1 - biophysical_df[
+        [f'rc_{soil_group}' for soil_group in ['a', 'b', 'c', 'd']]
+    ]).to_numpy(dtype=numpy.float32)
 
     # Calculate stormwater retention ratio and volume from
     # LULC, soil groups, biophysical data, and precipitation
@@ -293,7 +327,7 @@ def execute(args):
             files['lulc_aligned_path'],
             files['soil_group_aligned_path'],
             retention_ratio_array,
-            sorted_lucodes,
+            lucode_lookup,
             files['retention_ratio_path']),
         target_path_list=[files['retention_ratio_path']],
         dependent_task_list=[align_task],
@@ -304,98 +338,126 @@ def execute(args):
     if args['adjust_retention_ratios']:
         # in raster coord system units
         radius = float(args['retention_radius'])
-        # boolean mapping for each LULC code whether it's connected
-        is_connected_map = {
-            lucode: 1 if biophysical_dict[lucode]['is_connected'] else 0
-            for lucode in biophysical_dict}
-
-        reproject_roads_task = task_graph.add_task(
-            func=pygeoprocessing.reproject_vector,
-            args=(
-                args['road_centerlines_path'],
-                source_lulc_raster_info['projection_wkt'],
-                files['reprojected_centerlines_path']),
-            kwargs={'driver_name': 'GPKG'},
-            target_path_list=[files['reprojected_centerlines_path']],
-            task_name='reproject road centerlines vector to match rasters',
-            dependent_task_list=[])
-
-        # for gdal.GDT_Byte, setting the datatype is not enough
-        # must also set PIXELTYPE=DEFAULT to guarantee unsigned byte type
-        # otherwise, `new_raster_from_base` may pass down the
-        # PIXELTYPE=SIGNEDBYTE attribute from a signed base to the new raster
-        creation_opts = pygeoprocessing.geoprocessing_core.DEFAULT_GTIFF_CREATION_TUPLE_OPTIONS[1]  # noqa
-        unsigned_byte_creation_opts = creation_opts + ('PIXELTYPE=DEFAULT',)
-        # pygeoprocessing.rasterize expects the target raster to already exist
-        make_raster_task = task_graph.add_task(
-            func=pygeoprocessing.new_raster_from_base,
-            args=(
-                files['lulc_aligned_path'],
-                files['rasterized_centerlines_path'],
-                gdal.GDT_Byte,
-                [UINT8_NODATA]),
-            kwargs={
-                'raster_driver_creation_tuple': (
-                    'GTIFF', unsigned_byte_creation_opts)
-            },
-            target_path_list=[files['rasterized_centerlines_path']],
-            task_name='create raster to pass to pygeoprocessing.rasterize',
-            dependent_task_list=[align_task])
-
-        rasterize_centerlines_task = task_graph.add_task(
-            func=pygeoprocessing.rasterize,
-            args=(
-                files['reprojected_centerlines_path'],
-                files['rasterized_centerlines_path'],
-                [1]),
-            target_path_list=[files['rasterized_centerlines_path']],
-            task_name='rasterize road centerlines vector',
-            dependent_task_list=[make_raster_task, reproject_roads_task])
-
-        # Make a boolean raster showing which pixels are within the given
-        # radius of a road centerline
-        near_road_task = task_graph.add_task(
-            func=is_near,
-            args=(
-                files['rasterized_centerlines_path'],
-                radius / avg_pixel_size,  # convert the radius to pixels
-                files['road_distance_path'],
-                files['near_road_path']),
-            target_path_list=[
-                files['road_distance_path'],
-                files['near_road_path']],
-            task_name='find pixels within radius of road centerlines',
-            dependent_task_list=[rasterize_centerlines_task])
-
-        # Make a boolean raster indicating which pixels are directly
-        # connected impervious LULC type
-        connected_lulc_task = task_graph.add_task(
-            func=pygeoprocessing.reclassify_raster,
-            args=(
-                (files['lulc_aligned_path'], 1),
-                is_connected_map,
-                files['connected_lulc_path'],
-                gdal.GDT_Byte,
-                UINT8_NODATA),
-            target_path_list=[files['connected_lulc_path']],
-            task_name='calculate binary connected lulc raster',
-            dependent_task_list=[align_task]
-        )
-
-        # Make a boolean raster showing which pixels are within the given
-        # radius of connected land cover
-        near_connected_lulc_task = task_graph.add_task(
-            func=is_near,
-            args=(
-                files['connected_lulc_path'],
-                radius / avg_pixel_size,  # convert the radius to pixels
-                files['connected_lulc_distance_path'],
-                files['near_connected_lulc_path']),
-            target_path_list=[
-                files['connected_lulc_distance_path'],
-                files['near_connected_lulc_path']],
-            task_name='find pixels within radius of connected lulc',
-            dependent_task_list=[connected_lulc_task])
+        # array mapping each LULC code to whether it's connected (1) or not
+        is_connected_array = biophysical_df['is_connected'].fillna(
+            0).astype(bool).to_numpy(dtype=numpy.uint8)
+
+        # the distance transforms are only needed if there is something to
+        # measure the distance to. if there are no connected LULC classes, or
+        # no roads, then no pixel is near them.
+        adjust_dependencies = [retention_ratio_task]
+        road_vector = gdal.OpenEx(args['road_centerlines_path'],
+                                  gdal.OF_VECTOR)
+        n_roads = road_vector.GetLayer().GetFeatureCount()
+        road_vector = None
+        if n_roads:
+            reproject_roads_task = task_graph.add_task(
+                func=pygeoprocessing.reproject_vector,
+                args=(
+                    args['road_centerlines_path'],
+                    source_lulc_raster_info['projection_wkt'],
+                    files['reprojected_centerlines_path']),
+                kwargs={'driver_name': 'GPKG'},
+                target_path_list=[files['reprojected_centerlines_path']],
+                task_name='reproject road centerlines vector to match rasters',
+                dependent_task_list=[])
+
+            # for gdal.GDT_Byte, setting the datatype is not enough
+            # must also set PIXELTYPE=DEFAULT to guarantee unsigned byte type
+            # otherwise, `new_raster_from_base` may pass down the
+            # PIXELTYPE=SIGNEDBYTE attribute from a signed base to the new
+            # raster
+            creation_opts = pygeoprocessing.geoprocessing_core.DEFAULT_GTIFF_CREATION_TUPLE_OPTIONS[1]  # noqa
+            unsigned_byte_creation_opts = creation_opts + (
+                'PIXELTYPE=DEFAULT',)
+            # pygeoprocessing.rasterize expects the target raster to already
+            # exist
+            make_raster_task = task_graph.add_task(
+                func=pygeoprocessing.new_raster_from_base,
+                args=(
+                    files['lulc_aligned_path'],
+                    files['rasterized_centerlines_path'],
+                    gdal.GDT_Byte,
+                    [UINT8_NODATA]),
+                kwargs={
+                    'raster_driver_creation_tuple': (
+                        'GTIFF', unsigned_byte_creation_opts)
+                },
+                target_path_list=[files['rasterized_centerlines_path']],
+                task_name='create raster to pass to pygeoprocessing.rasterize',
+                dependent_task_list=[align_task])
+
+            rasterize_centerlines_task = task_graph.add_task(
+                func=pygeoprocessing.rasterize,
+                args=(
+                    files['reprojected_centerlines_path'],
+                    files['rasterized_centerlines_path'],
+                    [1]),
+                target_path_list=[files['rasterized_centerlines_path']],
+                task_name='rasterize road centerlines vector',
+                dependent_task_list=[make_raster_task, reproject_roads_task])
+
+            # Make a boolean raster showing which pixels are within the given
+            # radius of a road centerline
+            near_road_task = task_graph.add_task(
+                func=is_near,
+                args=(
+                    files['rasterized_centerlines_path'],
+                    radius / avg_pixel_size,  # convert the radius to pixels
+                    files['road_distance_path'],
+                    files['near_road_path']),
+                target_path_list=[
+                    files['road_distance_path'],
+                    files['near_road_path']],
+                task_name='find pixels within radius of road centerlines',
+                dependent_task_list=[rasterize_centerlines_task])
+            near_road_input = (files['near_road_path'], 1)
+            adjust_dependencies.append(near_road_task)
+        else:
+            LOGGER.info('The road centerlines vector has no features. '
+                        'No pixels are near a road.')
+            near_road_input = (0, 'raw')
+
+        if is_connected_array.any():
+            # Make a boolean raster indicating which pixels are directly
+            # connected impervious LULC type
+            connected_lulc_task = task_graph.add_task(
+                func=pygeoprocessing.raster_calculator,
+                args=([
+                    (files['lulc_aligned_path'], 1),
+                    (lulc_nodata, 'raw'),
+                    (lucode_lookup, 'raw'),
+                    (is_connected_array, 'raw')],
+                    connected_lulc_op,
+                    files['connected_lulc_path'],
+                    gdal.GDT_Byte,
+                    UINT8_NODATA),
+                target_path_list=[files['connected_lulc_path']],
+                task_name='calculate binary connected lulc raster',
+                dependent_task_list=[align_task]
+            )
+
+            # Make a boolean raster showing which pixels are within the given
+            # radius of connected land cover
+            near_connected_lulc_task = task_graph.add_task(
+                func=is_near,
+                args=(
+                    files['connected_lulc_path'],
+                    radius / avg_pixel_size,  # convert the radius to pixels
+                    files['connected_lulc_distance_path'],
+                    files['near_connected_lulc_path']),
+                target_path_list=[
+                    files['connected_lulc_distance_path'],
+                    files['near_connected_lulc_path']],
+                task_name='find pixels within radius of connected lulc',
+                dependent_task_list=[connected_lulc_task])
+            near_connected_lulc_input = (files['near_connected_lulc_path'], 1)
+            adjust_dependencies.append(near_connected_lulc_task)
+        else:
+            LOGGER.info('No LULC classes are marked as connected in the '
+                        'biophysical table. No pixels are near connected '
+                        'LULC.')
+            near_connected_lulc_input = (0, 'raw')
 
         average_ratios_task = task_graph.add_task(
             func=raster_average,
@@ -407,6 +469,7 @@ def execute(args):
             target_path_list=[files['ratio_average_path']],
             task_name='average retention ratios within radius',
             dependent_task_list=[retention_ratio_task])
+        adjust_dependencies.append(average_ratios_task)
 
         # Using the averaged retention ratio raster and boolean
         # "within radius" rasters, adjust the retention ratios
@@ -415,16 +478,15 @@ def execute(args):
             args=([
                 (files['retention_ratio_path'], 1),
                 (files['ratio_average_path'], 1),
-                (files['near_connected_lulc_path'], 1),
-                (files['near_road_path'], 1)],
+                near_connected_lulc_input,
+                near_road_input],
                 adjust_op,
                 files['adjusted_retention_ratio_path'],
                 gdal.GDT_Float32,
                 FLOAT_NODATA),
             target_path_list=[files['adjusted_retention_ratio_path']],
             task_name='adjust stormwater retention ratio',
-            dependent_task_list=[retention_ratio_task, average_ratios_task,
-                                 near_connected_lulc_task, near_road_task])
+            dependent_task_list=adjust_dependencies)
 
         final_retention_ratio_path = files['adjusted_retention_ratio_path']
         final_retention_ratio_task = adjust_retention_ratio_task
@@ -432,21 +494,57 @@ def execute(args):
         final_retention_ratio_path = files['retention_ratio_path']
         final_retention_ratio_task = retention_ratio_task
 
-    # Calculate stormwater retention volume from ratios and precipitation
+    # get all EMC columns from the biophysical table
+    # strip the first four characters off 'EMC_pollutant' to get pollutant name
+    pollutants = [column[4:] for column in biophysical_df.columns
+                  if column.startswith('emc_')]
+    LOGGER.debug(f'Pollutants found in biophysical table: {pollutants}')
+    # make an array for each pollutant mapping each LULC code to its EMC value
+    emc_arrays = [
+        biophysical_df[f'emc_{pollutant}'].to_numpy(dtype=numpy.float32)
+        for pollutant in pollutants]
+    # two output rasters for each pollutant
+    avoided_load_paths = [
+        os.path.join(
+            output_dir, f'avoided_pollutant_load_{pollutant}{suffix}.tif')
+        for pollutant in pollutants]
+    actual_load_paths = [
+        os.path.join(
+            output_dir, f'actual_pollutant_load_{pollutant}{suffix}.tif')
+        for pollutant in pollutants]
+
+    # (Optional) Do valuation if a replacement cost is defined
+    # you could theoretically have a cost of 0 which should be allowed
+    if 'replacement_cost' in args and args['replacement_cost'] not in [
+            None, '']:
+        replacement_cost = float(args['replacement_cost'])
+        retention_target_paths = [
+            files['retention_volume_path'], files['retention_value_path']]
+    else:
+        replacement_cost = None
+        retention_target_paths = [files['retention_volume_path']]
+
+    # Calculate stormwater retention volume from ratios and precipitation,
+    # along with the avoided pollutant loads and retention value, which are
+    # calculated from the retention volume
     retention_volume_task = task_graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([
-            (final_retention_ratio_path, 1),
-            (files['precipitation_aligned_path'], 1),
-            (precipitation_nodata, 'raw'),
-            (pixel_area, 'raw')],
-            volume_op,
-            files['retention_volume_path'],
-            gdal.GDT_Float32,
-            FLOAT_NODATA),
-        target_path_list=[files['retention_volume_path']],
+        func=calculate_volume_products,
+        args=(
+            final_retention_ratio_path,
+            files['precipitation_aligned_path'],
+            files['lulc_aligned_path'],
+            pixel_area,
+            lucode_lookup,
+            files['retention_volume_path']),
+        kwargs={
+            'emc_arrays': emc_arrays,
+            'load_paths': avoided_load_paths,
+            'replacement_cost': replacement_cost,
+            'value_path': files['retention_value_path']},
+        target_path_list=retention_target_paths + avoided_load_paths,
         dependent_task_list=[align_task, final_retention_ratio_task],
-        task_name='calculate stormwater retention volume'
+        task_name='calculate stormwater retention volume, value and '
+                  'avoided pollutant loads'
     )
 
     # Calculate stormwater runoff ratios and volume
@@ -463,22 +561,27 @@ def execute(args):
         task_name='calculate stormwater runoff ratio'
     )
 
+    # Calculate the actual pollutant loads from the runoff volume along with
+    # the runoff volume itself
     runoff_volume_task = task_graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([
-            (files['runoff_ratio_path'], 1),
-            (files['precipitation_aligned_path'], 1),
-            (precipitation_nodata, 'raw'),
-            (pixel_area, 'raw')],
-            volume_op,
-            files['runoff_volume_path'],
-            gdal.GDT_Float32,
-            FLOAT_NODATA),
-        target_path_list=[files['runoff_volume_path']],
+        func=calculate_volume_products,
+        args=(
+            files['runoff_ratio_path'],
+            files['precipitation_aligned_path'],
+            files['lulc_aligned_path'],
+            pixel_area,
+            lucode_lookup,
+            files['runoff_volume_path']),
+        kwargs={
+            'emc_arrays': emc_arrays,
+            'load_paths': actual_load_paths},
+        target_path_list=[files['runoff_volume_path']] + actual_load_paths,
         dependent_task_list=[align_task, runoff_ratio_task],
-        task_name='calculate stormwater runoff volume'
+        task_name='calculate stormwater runoff volume and actual pollutant '
+                  'loads'
     )
-    aggregation_task_dependencies = [retention_volume_task]
+    aggregation_task_dependencies = [
+        retention_volume_task, runoff_volume_task]
     data_to_aggregate = [
         # tuple of (raster path, output field name, op) for aggregation
         (final_retention_ratio_path, 'mean_retention_ratio', 'mean'),
@@ -488,21 +591,19 @@ def execute(args):
 
     # (Optional) Calculate stormwater percolation ratio and volume from
     # LULC, soil groups, biophysical table, and precipitation
-    if 'pe_a' in next(iter(biophysical_dict.values())):
+    if 'pe_a' in biophysical_df.columns:
         LOGGER.info('percolation data detected in biophysical table. '
                     'Will calculate percolation ratio and volume rasters.')
-        percolation_ratio_array = numpy.array([
-            [biophysical_dict[lucode][f'pe_{soil_group}']
-                for soil_group in ['a', 'b', 'c', 'd']
-             ] for lucode in sorted_lucodes
-        ], dtype=numpy.float32)
+        percolation_ratio_array = biophysical_df[
+            [f'pe_{soil_group}' for soil_group in ['a', 'b', 'c', 'd']]
+        ].to_numpy(dtype=numpy.float32)
         percolation_ratio_task = task_graph.add_task(
             func=lookup_ratios,
             args=(
                 files['lulc_aligned_path'],
                 files['soil_group_aligned_path'],
                 percolation_ratio_array,
-                sorted_lucodes,
+                lucode_lookup,
                 files['percolation_ratio_path']),
             target_path_list=[files['percolation_ratio_path']],
             dependent_task_list=[align_task],
@@ -529,87 +630,14 @@ def execute(args):
         data_to_aggregate.append((files['percolation_volume_path'],
                                  'total_percolation_volume', 'sum'))
 
-    # get all EMC columns from an arbitrary row in the dictionary
-    # strip the first four characters off 'EMC_pollutant' to get pollutant name
-    pollutants = [key[4:] for key in next(iter(biophysical_dict.values()))
-                  if key.startswith('emc_')]
-    LOGGER.debug(f'Pollutants found in biophysical table: {pollutants}')
-
-    # Calculate avoided pollutant load for each pollutant from retention volume
-    # and biophysical table EMC value
-    avoided_load_paths = []
-    actual_load_paths = []
-    for pollutant in pollutants:
-        # two output rasters for each pollutant
-        avoided_pollutant_load_path = os.path.join(
-            output_dir, f'avoided_pollutant_load_{pollutant}{suffix}.tif')
-        avoided_load_paths.append(avoided_pollutant_load_path)
-        actual_pollutant_load_path = os.path.join(
-            output_dir, f'actual_pollutant_load_{pollutant}{suffix}.tif')
-        actual_load_paths.append(actual_pollutant_load_path)
-        # make an array mapping each LULC code to the pollutant EMC value
-        emc_array = numpy.array(
-            [biophysical_dict[lucode][f'emc_{pollutant}']
-                for lucode in sorted_lucodes], dtype=numpy.float32)
-
-        # calculate avoided load from retention volume
-        avoided_load_task = task_graph.add_task(
-            func=pygeoprocessing.raster_calculator,
-            args=([
-                (files['lulc_aligned_path'], 1),
-                (lulc_nodata, 'raw'),
-                (files['retention_volume_path'], 1),
-                (sorted_lucodes, 'raw'),
-                (emc_array, 'raw')],
-                pollutant_load_op,
-                avoided_pollutant_load_path,
-                gdal.GDT_Float32,
-                FLOAT_NODATA),
-            target_path_list=[avoided_pollutant_load_path],
-            dependent_task_list=[retention_volume_task],
-            task_name=f'calculate avoided pollutant {pollutant} load'
-        )
-        # calculate actual load from runoff volume
-        actual_load_task = task_graph.add_task(
-            func=pygeoprocessing.raster_calculator,
-            args=([
-                (files['lulc_aligned_path'], 1),
-                (lulc_nodata, 'raw'),
-                (files['runoff_volume_path'], 1),
-                (sorted_lucodes, 'raw'),
-                (emc_array, 'raw')],
-                pollutant_load_op,
-                actual_pollutant_load_path,
-                gdal.GDT_Float32,
-                FLOAT_NODATA),
-            target_path_list=[actual_pollutant_load_path],
-            dependent_task_list=[runoff_volume_task],
-            task_name=f'calculate actual pollutant {pollutant} load'
-        )
-        aggregation_task_dependencies += [avoided_load_task, actual_load_task]
+    for pollutant, avoided_pollutant_load_path, actual_pollutant_load_path \
+            in zip(pollutants, avoided_load_paths, actual_load_paths):
         data_to_aggregate.append((avoided_pollutant_load_path,
                                  f'{pollutant}_total_avoided_load', 'sum'))
         data_to_aggregate.append(
             (actual_pollutant_load_path, f'{pollutant}_total_load', 'sum'))
 
-    # (Optional) Do valuation if a replacement cost is defined
-    # you could theoretically have a cost of 0 which should be allowed
-    if 'replacement_cost' in args and args['replacement_cost'] not in [
-            None, '']:
-        valuation_task = task_graph.add_task(
-            func=pygeoprocessing.raster_calculator,
-            args=([
-                (files['retention_volume_path'], 1),
-                (float(args['replacement_cost']), 'raw')],
-                retention_value_op,
-                files['retention_value_path'],
-                gdal.GDT_Float32,
-                FLOAT_NODATA),
-            target_path_list=[files['retention_value_path']],
-            dependent_task_list=[retention_volume_task],
-            task_name='calculate stormwater retention value'
-        )
-        aggregation_task_dependencies.append(valuation_task)
+    if replacement_cost is not None:
         data_to_aggregate.append(
             (files['retention_value_path'], 'total_retention_value', 'sum'))
 
@@ -631,20 +659,21 @@ def execute(args):
     task_graph.join()
 
 
-def lookup_ratios(lulc_path, soil_group_path, ratio_lookup, sorted_lucodes,
+def lookup_ratios(lulc_path, soil_group_path, ratio_lookup, lucode_lookup,
                   output_path):
     """Look up retention/percolation ratios from LULC codes and soil groups.
 
     Args:
-        lulc_array (numpy.ndarray): 2D array of LULC codes
-        soil_group_array (numpy.ndarray): 2D array with the same shape as
-            ``lulc_array``. Values in {1, 2, 3, 4} corresponding to soil
-            groups A, B, C, and D.
+        lulc_path (str): path to a raster of LULC codes
+        soil_group_path (str): path to a raster aligned with ``lulc_path``.
+            Values in {1, 2, 3, 4} corresponding to soil groups A, B, C,
+            and D.
         ratio_lookup (numpy.ndarray): 2D array where rows correspond to
             sorted LULC codes and the 4 columns correspond to soil groups
             A, B, C, D in order. Shape: (number of lulc codes, 4).
-        sorted_lucodes (list[int]): List of LULC codes sorted from smallest
-            to largest. These correspond to the rows of ``ratio_lookup``.
+        lucode_lookup (tuple): lookup from each LULC code to its index in the
+            sorted list of LULC codes, as returned by ``make_lucode_lookup``.
+            These indexes correspond to the rows of ``ratio_lookup``.
         output_path (str): path to a raster to write out the result. has the
             same shape as the lulc and soil group rasters. Each value is the
             corresponding ratio for that LULC code x soil group pair.
@@ -660,21 +689,38 @@ def lookup_ratios(lulc_path, soil_group_path, ratio_lookup, sorted_lucodes,
     # decrementing every value in a large raster.
     ratio_lookup = numpy.insert(ratio_lookup, 0,
                                 numpy.zeros(ratio_lookup.shape[0]), axis=1)
+    # flatten the lookup so that each ratio is found with a single index:
+    # the ratio for row i and soil group j is at i * n_columns + j
+    n_columns = ratio_lookup.shape[1]
+    flat_ratio_lookup = ratio_lookup.ravel()
 
     def ratio_op(lulc_array, soil_group_array):
         output_ratio_array = numpy.full(lulc_array.shape, FLOAT_NODATA,
                                         dtype=numpy.float32)
-        valid_mask = numpy.full(lulc_array.shape, True)
-        if lulc_nodata is not None:
-            valid_mask &= ~utils.array_equals_nodata(lulc_array, lulc_nodata)
-        if soil_group_nodata is not None:
-            valid_mask &= ~utils.array_equals_nodata(
-                soil_group_array, soil_group_nodata)
+        # build the mask in place rather than allocating a new array for
+        # each step
+        valid_mask = utils.array_equals_nodata(lulc_array, lulc_nodata)
+        valid_mask |= utils.array_equals_nodata(
+            soil_group_array, soil_group_nodata)
+        numpy.logical_not(valid_mask, out=valid_mask)
+
+        # a soil group outside of 1-4 would otherwise index into the
+        # placeholder column or a neighboring row of the flattened lookup
+        soil_groups = soil_group_array[valid_mask]
+        if soil_groups.size and (
+                soil_groups.min() < 1 or soil_groups.max() > 4):
+            invalid_soil_groups = numpy.unique(soil_groups[
+                (soil_groups < 1) | (soil_groups > 4)])
+            raise ValueError(
+                f'Soil group values {invalid_soil_groups.tolist()} were found '
+                'in the soil group raster, but soil groups must be 1, 2, 3, '
+                'or 4.')
+
         # the index of each lucode in the sorted lucodes array
-        lulc_index = numpy.digitize(lulc_array[valid_mask], sorted_lucodes,
-                                    right=True)
-        output_ratio_array[valid_mask] = (
-            ratio_lookup[lulc_index, soil_group_array[valid_mask]])
+        flat_index = lucodes_to_indexes(lulc_array[valid_mask], lucode_lookup)
+        flat_index *= n_columns
+        flat_index += soil_groups
+        output_ratio_array[valid_mask] = flat_ratio_lookup.take(flat_index)
         return output_ratio_array
 
     pygeoprocessing.raster_calculator(
@@ -685,6 +731,115 @@ def lookup_ratios(lulc_path, soil_group_path, ratio_lookup, sorted_lucodes,
         FLOAT_NODATA)
 
 
+def calculate_volume_products(ratio_path, precipitation_path, lulc_path,
+                              pixel_area, lucode_lookup, volume_path,
+                              emc_arrays=(), load_paths=(),
+                              replacement_cost=None, value_path=None):
+    """Calculate a stormwater volume and the rasters derived from it.
+
+    The volume, pollutant loads, and value are all calculated in one pass
+    over the input rasters, so that the volume raster doesn't have to be
+    read back in for each derived output.
+
+    Args:
+        ratio_path (str): path to a raster of stormwater ratios. Its nodata
+            value is assumed to be the global FLOAT_NODATA.
+        precipitation_path (str): path to a raster of precipitation amounts
+            in millimeters/year, aligned with ``ratio_path``
+        lulc_path (str): path to a LULC raster aligned with ``ratio_path``
+        pixel_area (float): area of each pixel in m^2
+        lucode_lookup (tuple): lookup from each LULC code to its index in the
+            sorted list of LULC codes, as returned by ``make_lucode_lookup``.
+        volume_path (str): path to write out the stormwater volume raster
+        emc_arrays (list[numpy.ndarray]): list of 1D arrays of pollutant EMC
+            values for each lucode, one for each pollutant. See
+            ``pollutant_load_op``.
+        load_paths (list[str]): list of paths to write out the pollutant load
+            rasters, one for each array in ``emc_arrays``.
+        replacement_cost (float): replacement cost of stormwater volume in
+            currency units/m^3. If None, the value raster is not calculated.
+        value_path (str): path to write out the stormwater volume value
+            raster. Only used if ``replacement_cost`` is not None.
+
+    Returns:
+        None
+    """
+    precipitation_nodata = pygeoprocessing.get_raster_info(
+        precipitation_path)['nodata'][0]
+    lulc_nodata = pygeoprocessing.get_raster_info(lulc_path)['nodata'][0]
+    n_cols, n_rows = pygeoprocessing.get_raster_info(
+        ratio_path)['raster_size']
+    n_pixels = n_cols * n_rows
+
+    target_paths = [volume_path] + list(load_paths)
+    if replacement_cost is not None:
+        target_paths.append(value_path)
+    for target_path in target_paths:
+        pygeoprocessing.new_raster_from_base(
+            ratio_path, target_path, gdal.GDT_Float32, [FLOAT_NODATA])
+
+    ratio_raster = gdal.OpenEx(ratio_path, gdal.OF_RASTER)
+    ratio_band = ratio_raster.GetRasterBand(1)
+    precipitation_raster = gdal.OpenEx(precipitation_path, gdal.OF_RASTER)
+    precipitation_band = precipitation_raster.GetRasterBand(1)
+    lulc_raster = gdal.OpenEx(lulc_path, gdal.OF_RASTER)
+    lulc_band = lulc_raster.GetRasterBand(1)
+    target_rasters = [
+        gdal.OpenEx(target_path, gdal.OF_RASTER | gdal.GA_Update)
+        for target_path in target_paths]
+    volume_band, *target_bands = [
+        target_raster.GetRasterBand(1) for target_raster in target_rasters]
+    load_bands = target_bands[:len(load_paths)]
+
+    # log progress every 5 seconds, as raster_calculator does
+    volume_name = os.path.basename(volume_path)
+    n_pixels_processed = 0
+    last_log_time = time.time()
+    for offsets in pygeoprocessing.iterblocks((ratio_path, 1),
+                                              offset_only=True):
+        if time.time() - last_log_time >= 5.0:
+            LOGGER.info(
+                f'{volume_name} {n_pixels_processed / n_pixels * 100:.1f}% '
+                'complete')
+            last_log_time = time.time()
+
+        volume_array = volume_op(
+            ratio_band.ReadAsArray(**offsets),
+            precipitation_band.ReadAsArray(**offsets),
+            precipitation_nodata,
+            pixel_area)
+        volume_band.WriteArray(
+            volume_array, xoff=offsets['xoff'], yoff=offsets['yoff'])
+
+        if load_bands:
+            lulc_array = lulc_band.ReadAsArray(**offsets)
+        for emc_array, load_band in zip(emc_arrays, load_bands):
+            load_band.WriteArray(
+                pollutant_load_op(lulc_array, lulc_nodata, volume_array,
+                                  lucode_lookup, emc_array),
+                xoff=offsets['xoff'], yoff=offsets['yoff'])
+
+        if replacement_cost is not None:
+            target_bands[-1].WriteArray(
+                retention_value_op(volume_array, replacement_cost),
+                xoff=offsets['xoff'], yoff=offsets['yoff'])
+        n_pixels_processed += volume_array.size
+    LOGGER.info(f'{volume_name} 100.0% complete')
+
+    ratio_band = None
+    ratio_raster = None
+    precipitation_band = None
+    precipitation_raster = None
+    lulc_band = None
+    lulc_raster = None
+    volume_band = None
+    load_bands = None
+    target_bands = None
+    for target_raster in target_rasters:
+        target_raster.FlushCache()
+    target_rasters = None
+
+
 def volume_op(ratio_array, precip_array, precip_nodata, pixel_area):
     """Calculate stormwater volumes from precipitation and ratios.
 
@@ -699,18 +854,22 @@ def volume_op(ratio_array, precip_array, precip_nodata, pixel_area):
     Returns:
         2D numpy.ndarray of precipitation volumes in m^3/year
     """
-    volume_array = numpy.full(ratio_array.shape, FLOAT_NODATA,
-                              dtype=numpy.float32)
-    valid_mask = ~utils.array_equals_nodata(ratio_array, FLOAT_NODATA)
+    valid_mask = ratio_array != FLOAT_NODATA
     if precip_nodata is not None:
         valid_mask &= ~utils.array_equals_nodata(precip_array, precip_nodata)
 
+    # calculate every pixel and then fill in nodata, which is faster than
+    # selecting out the valid pixels. nodata pixels may overflow, but they
+    # are overwritten anyway.
     # precipitation (mm/yr) * pixel area (m^2) *
     # 0.001 (m/mm) * ratio = volume (m^3/yr)
-    volume_array[valid_mask] = (
-        precip_array[valid_mask] *
-        ratio_array[valid_mask] *
-        pixel_area * 0.001)
+    # multiply the constants together first so it's one less pass over
+    # the block
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        volume_array = (
+            precip_array * ratio_array * (pixel_area * 0.001)
+        ).astype(numpy.float32, copy=False)
+    volume_array[~valid_mask] = FLOAT_NODATA
     return volume_array
 
 
@@ -724,14 +883,12 @@ def retention_to_runoff_op(retention_array):
     Returns:
         numpy.ndarray of stormwater runoff ratios
     """
-    runoff_array = numpy.full(retention_array.shape, FLOAT_NODATA,
-                              dtype=numpy.float32)
-    valid_mask = ~utils.array_equals_nodata(retention_array, FLOAT_NODATA)
-    runoff_array[valid_mask] = 1 - retention_array[valid_mask]
+    runoff_array = (1 - retention_array).astype(numpy.float32, copy=False)
+    runoff_array[retention_array == FLOAT_NODATA] = FLOAT_NODATA
     return runoff_array
 
 
-def pollutant_load_op(lulc_array, lulc_nodata, volume_array, sorted_lucodes,
+def pollutant_load_op(lulc_array, lulc_nodata, volume_array, lucode_lookup,
                       emc_array):
     """Calculate pollutant loads from EMC and stormwater volumes.
 
@@ -745,11 +902,11 @@ def pollutant_load_op(lulc_array, lulc_nodata, volume_array, sorted_lucodes,
         volume_array (numpy.ndarray): 2D array of stormwater volumes, with the
             same shape as ``lulc_array``. It is assumed that the volume nodata
             value is the global FLOAT_NODATA.
-        sorted_lucodes (numpy.ndarray): 1D array of the LULC codes in order
-            from smallest to largest
+        lucode_lookup (tuple): lookup from each LULC code to its index in the
+            sorted list of LULC codes, as returned by ``make_lucode_lookup``.
         emc_array (numpy.ndarray): 1D array of pollutant EMC values for each
-            lucode. ``emc_array[i]`` is the EMC for the LULC class at
-            ``sorted_lucodes[i]``.
+            lucode. ``emc_array[i]`` is the EMC for the LULC class at index
+            ``i`` of the sorted list of LULC codes.
 
     Returns:
         2D numpy.ndarray with the same shape as ``lulc_array``.
@@ -758,24 +915,127 @@ def pollutant_load_op(lulc_array, lulc_nodata, volume_array, sorted_lucodes,
     """
     load_array = numpy.full(
         lulc_array.shape, FLOAT_NODATA, dtype=numpy.float32)
-    valid_mask = ~utils.array_equals_nodata(volume_array, FLOAT_NODATA)
+    valid_mask = volume_array != FLOAT_NODATA
     if lulc_nodata is not None:
         valid_mask &= ~utils.array_equals_nodata(lulc_array, lulc_nodata)
 
-    # bin each value in the LULC array such that
-    # lulc_array[i,j] == sorted_lucodes[lulc_index[i,j]]. thus,
-    # emc_array[lulc_index[i,j]] is the EMC for the lucode at lulc_array[i,j]
-    lulc_index = numpy.digitize(lulc_array, sorted_lucodes, right=True)
-    # need to mask out nodata pixels from lulc_index before indexing emc_array
-    # otherwise we get an IndexError when the nodata value is > all LULC values
-    valid_lulc_index = lulc_index[valid_mask]
+    # emc_array[lulc_index[i]] is the EMC for the lucode of valid pixel i.
+    # nodata pixels are masked out first, because the nodata value usually
+    # isn't a code in the biophysical table.
+    lulc_index = lucodes_to_indexes(lulc_array[valid_mask], lucode_lookup)
     # EMC for pollutant (mg/L) * 1000 (L/m^3) * 0.000001 (kg/mg) *
     # retention (m^3/yr) = pollutant load (kg/yr)
-    load_array[valid_mask] = (emc_array[valid_lulc_index] *
-                              0.001 * volume_array[valid_mask])
+    # convert the units of the (short) EMC array before looking up the EMC
+    # for each pixel, rather than converting each pixel
+    load_array[valid_mask] = (
+        (emc_array * 0.001)[lulc_index] * volume_array[valid_mask])
     return load_array
 
 
+def connected_lulc_op(lulc_array, lulc_nodata, lucode_lookup,
+                      is_connected_array):
+    """Look up whether each LULC code is directly-connected impervious.
+
+    Args:
+        lulc_array (numpy.ndarray): 2D array of LULC codes
+        lulc_nodata (int): nodata value for the LULC array
+        lucode_lookup (tuple): lookup from each LULC code to its index in the
+            sorted list of LULC codes, as returned by ``make_lucode_lookup``.
+        is_connected_array (numpy.ndarray): 1D uint8 array where
+            ``is_connected_array[i]`` is 1 if the LULC class at index ``i``
+            of the sorted list of LULC codes is connected, 0 if not.
+
+    Returns:
+        2D numpy.ndarray with the same shape as ``lulc_array``. Each value is
+        1 if the pixel's LULC class is connected, 0 if not, or UINT8_NODATA
+        where the LULC is nodata.
+    """
+    connected_array = numpy.full(
+        lulc_array.shape, UINT8_NODATA, dtype=numpy.uint8)
+    valid_mask = ~utils.array_equals_nodata(lulc_array, lulc_nodata)
+    connected_array[valid_mask] = is_connected_array[
+        lucodes_to_indexes(lulc_array[valid_mask], lucode_lookup)]
+    return connected_array
+
+
+def make_lucode_lookup(sorted_lucodes):
+    """Make an array to look up the index of each LULC code.
+
+    Looking up a code's index in this array takes one step per pixel, where a
+    search through the sorted codes takes several. The array has an element
+    for every code between the smallest and largest, so if the codes are
+    very spread out, no array is made and the codes are searched instead.
+
+    Args:
+        sorted_lucodes (list[int]): List of LULC codes sorted from smallest
+            to largest.
+
+    Returns:
+        Tuple of ``(lookup_array, min_lucode, sorted_lucodes)``.
+        ``lookup_array`` is a 1D array where
+        ``lookup_array[lucode - min_lucode]`` is the index of ``lucode`` in
+        ``sorted_lucodes``, or -1 if ``lucode`` is not in ``sorted_lucodes``.
+        It is None if the range of codes is larger than
+        ``_MAX_LUCODE_LOOKUP_SIZE``. ``min_lucode`` is the smallest LULC
+        code. ``sorted_lucodes`` is the sorted LULC codes as an array.
+    """
+    sorted_lucodes = numpy.asarray(sorted_lucodes, dtype=numpy.int64)
+    min_lucode = int(sorted_lucodes[0])
+    lucode_range = int(sorted_lucodes[-1]) - min_lucode + 1
+    if lucode_range > _MAX_LUCODE_LOOKUP_SIZE:
+        return None, min_lucode, sorted_lucodes
+    lookup_array = numpy.full(lucode_range, -1, dtype=numpy.int32)
+    lookup_array[sorted_lucodes - min_lucode] = numpy.arange(
+        sorted_lucodes.size, dtype=numpy.int32)
+    return lookup_array, min_lucode, sorted_lucodes
+
+
+def lucodes_to_indexes(lulc_array, lucode_lookup):
+    """Look up the index of each LULC code in the sorted list of codes.
+
+    Args:
+        lulc_array (numpy.ndarray): array of LULC codes. Should not include
+            nodata pixels.
+        lucode_lookup (tuple): lookup from each LULC code to its index in the
+            sorted list of LULC codes, as returned by ``make_lucode_lookup``.
+
+    Returns:
+        numpy.ndarray of indexes with the same shape as ``lulc_array``
+
+    Raises:
+        ValueError if any of the codes in ``lulc_array`` are not in the
+        sorted list of LULC codes (the biophysical table)
+    """
+    lookup_array, min_lucode, sorted_lucodes = lucode_lookup
+    if lookup_array is None:
+        # the codes are too spread out for a lookup array, so search for them
+        index_array = numpy.minimum(
+            numpy.searchsorted(sorted_lucodes, lulc_array),
+            sorted_lucodes.size - 1)
+        missing_mask = sorted_lucodes[index_array] != lulc_array
+    else:
+        # offsets of 8- and 16-bit codes fit in 32 bits, which halves the
+        # memory used by the offset array compared to 64 bits
+        if lulc_array.dtype.itemsize <= 2 and abs(min_lucode) < 2**30:
+            offset_dtype = numpy.int32
+        else:
+            offset_dtype = numpy.int64
+        offset_array = lulc_array.astype(offset_dtype) - min_lucode
+        if offset_array.size and (offset_array.min() < 0 or
+                                  offset_array.max() >= lookup_array.size):
+            missing_mask = (
+                (offset_array < 0) | (offset_array >= lookup_array.size))
+        else:
+            index_array = lookup_array[offset_array]
+            missing_mask = index_array == -1
+    if missing_mask.any():
+        missing_lucodes = numpy.unique(lulc_array[missing_mask])
+        raise ValueError(
+            f'LULC codes {missing_lucodes.tolist()} were found in the LULC '
+            'raster but not in the biophysical table.')
+    return index_array
+
+
 def retention_value_op(retention_volume_array, replacement_cost):
     """Multiply retention volumes by the retention replacement cost.
 
@@ -788,14 +1048,10 @@ def retention_value_op(retention_volume_array, replacement_cost):
     Returns:
         numpy.ndarray of retention values with the same dimensions as the input
     """
-    value_array = numpy.full(retention_volume_array.shape, FLOAT_NODATA,
-                             dtype=numpy.float32)
-    valid_mask = ~utils.array_equals_nodata(
-        retention_volume_array, FLOAT_NODATA)
-
     # retention (m^3/yr) * replacement cost ($/m^3) = retention value ($/yr)
-    value_array[valid_mask] = (
-        retention_volume_array[valid_mask] * replacement_cost)
+    value_array = (retention_volume_array * replacement_cost).astype(
+        numpy.float32, copy=False)
+    value_array[retention_volume_array == FLOAT_NODATA] = FLOAT_NODATA
     return value_array
 
 
@@ -804,49 +1060,42 @@ def adjust_op(ratio_array, avg_ratio_array, near_connected_lulc_array,
     """Apply the retention ratio adjustment algorithm to an array of ratios.
 
     This is meant to be used with raster_calculator. Assumes that the nodata
-    value for all four input arrays is the global FLOAT_NODATA.
+    value of the two ratio arrays is the global FLOAT_NODATA, and the nodata
+    value of the two near arrays is the global UINT8_NODATA. The adjusted
+    ratio is calculated for every pixel, then set to FLOAT_NODATA wherever
+    any of the inputs is nodata.
 
     Args:
         ratio_array (numpy.ndarray): 2D array of stormwater retention ratios
         avg_ratio_array (numpy.ndarray): 2D array of averaged ratios
-        near_connected_lulc_array (numpy.ndarray): 2D boolean array where 1
-            means this pixel is near a directly-connected LULC area
-        near_road_array (numpy.ndarray): 2D boolean array where 1
-            means this pixel is near a road centerline
+        near_connected_lulc_array (numpy.ndarray or int): 2D uint8 array
+            where 1 means this pixel is near a directly-connected LULC area,
+            or the scalar 0 if no pixels are near connected LULC.
+        near_road_array (numpy.ndarray or int): 2D uint8 array where 1 means
+            this pixel is near a road centerline, or the scalar 0 if no
+            pixels are near a road.
 
     Returns:
         2D numpy array of adjusted retention ratios. Has the same shape as
-        ``retention_ratio_array``.
+        ``ratio_array``.
     """
-    adjusted_ratio_array = numpy.full(ratio_array.shape, FLOAT_NODATA,
-                                      dtype=numpy.float32)
-    adjustment_factor_array = numpy.full(ratio_array.shape, FLOAT_NODATA,
-                                         dtype=numpy.float32)
-    valid_mask = (
-        ~utils.array_equals_nodata(ratio_array, FLOAT_NODATA) &
-        ~utils.array_equals_nodata(avg_ratio_array, FLOAT_NODATA) &
-        (near_connected_lulc_array != UINT8_NODATA) &
-        (near_road_array != UINT8_NODATA))
+    valid_mask = ratio_array != FLOAT_NODATA
+    valid_mask &= avg_ratio_array != FLOAT_NODATA
+    valid_mask &= near_connected_lulc_array != UINT8_NODATA
+    valid_mask &= near_road_array != UINT8_NODATA
 
     # adjustment factor:
     # - 0 if any of the nearby pixels are impervious/connected;
     # - average of nearby pixels, otherwise
-    is_not_connected = ~(
-        near_connected_lulc_array[valid_mask] |
-        near_road_array[valid_mask]).astype(bool)
-    adjustment_factor_array[valid_mask] = (avg_ratio_array[valid_mask] *
-                                           is_not_connected)
-
-    adjustment_factor_array[valid_mask] = (
-        avg_ratio_array[valid_mask] * ~(
-            near_connected_lulc_array[valid_mask] |
-            near_road_array[valid_mask]
-        ).astype(bool))
+    is_not_near = (near_connected_lulc_array | near_road_array) == 0
 
+    # calculate every pixel and then fill in nodata, which is faster than
+    # selecting out the valid pixels
     # equation 2-4: Radj_ij = R_ij + (1 - R_ij) * C_ij
-    adjusted_ratio_array[valid_mask] = (
-        ratio_array[valid_mask] +
-        (1 - ratio_array[valid_mask]) * adjustment_factor_array[valid_mask])
+    adjusted_ratio_array = (
+        ratio_array + (1 - ratio_array) * avg_ratio_array * is_not_near
+    ).astype(numpy.float32, copy=False)
+    adjusted_ratio_array[~valid_mask] = FLOAT_NODATA
     return adjusted_ratio_array
 
 
@@ -874,24 +1123,29 @@ def aggregate_results(base_aggregate_areas_path, target_vector_path, srs_wkt,
     """
     pygeoprocessing.reproject_vector(base_aggregate_areas_path, srs_wkt,
                                      target_vector_path, driver_name='GPKG')
+    # aggregate each raster by the vector region(s)
+    aggregate_stats_list = [
+        pygeoprocessing.zonal_statistics((raster_path, 1), target_vector_path)
+        for raster_path, _, _ in aggregations]
+
     aggregate_vector = gdal.OpenEx(target_vector_path, gdal.GA_Update)
     aggregate_layer = aggregate_vector.GetLayer()
 
-    for raster_path, field_id, aggregation_op in aggregations:
-        # aggregate the raster by the vector region(s)
-        aggregate_stats = pygeoprocessing.zonal_statistics(
-            (raster_path, 1), target_vector_path)
-
-        # set up the field to hold the aggregate data
+    # set up the fields to hold the aggregate data
+    for _, field_id, _ in aggregations:
         aggregate_field = ogr.FieldDefn(field_id, ogr.OFTReal)
         aggregate_field.SetWidth(24)
         aggregate_field.SetPrecision(11)
         aggregate_layer.CreateField(aggregate_field)
-        aggregate_layer.ResetReading()
 
-        # save the aggregate data to the field for each feature
-        for feature in aggregate_layer:
-            feature_id = feature.GetFID()
+    # save the aggregate data to the fields for each feature, all in one
+    # pass over the features and one transaction
+    aggregate_layer.ResetReading()
+    aggregate_layer.StartTransaction()
+    for feature in aggregate_layer:
+        feature_id = feature.GetFID()
+        for (raster_path, field_id, aggregation_op), aggregate_stats in zip(
+                aggregations, aggregate_stats_list):
             if aggregation_op == 'mean':
                 pixel_count = aggregate_stats[feature_id]['count']
                 try:
@@ -903,7 +1157,8 @@ def aggregate_results(base_aggregate_areas_path, target_vector_path, srs_wkt,
             elif aggregation_op == 'sum':
                 value = aggregate_stats[feature_id]['sum']
             feature.SetField(field_id, float(value))
-            aggregate_layer.SetFeature(feature)
+        aggregate_layer.SetFeature(feature)
+    aggregate_layer.CommitTransaction()
 
     # save the aggregate vector layer and clean up references
     aggregate_layer.SyncToDisk()
@@ -938,7 +1193,9 @@ def is_near(input_path, radius, distance_path, out_path):
         """Binary array of elements less than or equal to the threshold."""
         # no need to mask nodata because distance_transform_edt doesn't
         # output any nodata pixels
-        return array <= threshold
+        # view the boolean result as uint8 (no copy) so that it's written to
+        # the byte raster without converting
+        return (array <= threshold).view(numpy.uint8)
 
     # Threshold that to a binary array so '1' means it's within the radius
     pygeoprocessing.raster_calculator(
@@ -1028,7 +1285,10 @@ def raster_average(raster_path, radius, kernel_path, out_path):
         kernel_path)
 
     # convolve the signal (input raster) with the kernel and normalize
-    # this is equivalent to taking an average of each pixel's neighborhood
+    # this is equivalent to taking an average of each pixel's neighborhood.
+    # convolve_2d uses FFT convolution on each block, so the cost doesn't grow
+    # with the square of the radius. a box filter would be cheaper still but
+    # would average over a square rather than a circle.
     pygeoprocessing.convolve_2d(
         (raster_path, 1),
         (kernel_path, 1),
@@ -488,6 +488,34 @@ def build_file_registry(base_file_path_list, file_suffix):
     return f_reg
 
 
+def drop_blank_table_rows(table, table_path):
+    """Warn about empty values in a table and drop any entirely blank rows.
+
+    Args:
+        table (pandas.DataFrame): a table read from ``table_path``
+        table_path (string): path to the CSV file that ``table`` was read
+            from, used in the warning messages
+
+    Returns:
+        ``table`` without the rows where every value is NA/NaN.
+    """
+    # look for NaN values and warn if any are found.
+    table_na = table.isna()
+    if table_na.values.any():
+        LOGGER.warning(
+            f"Empty or NaN values were found in the table: {table_path}.")
+    # look to see if an entire row is NA values
+    table_na_rows = table_na.all(axis=1)
+    na_rows = table_na_rows.index[table_na_rows].tolist()
+    # if a completely empty row, drop it
+    if na_rows:
+        LOGGER.warning(
+            "Encountered an entirely blank row on line(s)"
+            f" {[x+2 for x in na_rows]}. Dropping rows from table.")
+        table = table.dropna(how="all")
+    return table
+
+
 def build_lookup_from_csv(
         table_path, key_field, column_list=None, to_lower=True):
     """Read a CSV table into a dictionary indexed by ``key_field``.
@@ -563,20 +591,7 @@ def build_lookup_from_csv(
     if col_list:
         table = table.loc[:, col_list]
 
-    # look for NaN values and warn if any are found.
-    table_na = table.isna()
-    if table_na.values.any():
-        LOGGER.warning(
-            f"Empty or NaN values were found in the table: {table_path}.")
-    # look to see if an entire row is NA values
-    table_na_rows = table_na.all(axis=1)
-    na_rows = table_na_rows.index[table_na_rows].tolist()
-    # if a completely empty row, drop it
-    if na_rows:
-        LOGGER.warning(
-            "Encountered an entirely blank row on line(s)"
-            f" {[x+2 for x in na_rows]}. Dropping rows from table.")
-        table.dropna(how="all", inplace=True)
+    table = drop_blank_table_rows(table, table_path)
     # fill the rest of empty or NaN values with empty string
     table.fillna(value="", inplace=True)
     try:
@@ -1,4 +1,5 @@
 """Module for Testing DelineateIt."""
+import collections
 import contextlib
 import logging
 import os
@@ -449,6 +450,155 @@ class DelineateItTests(unittest.TestCase):
         self.assertEqual(len(points), 1)
         self.assertEqual((points[0].x, points[0].y), (9, -11))
 
+    def test_point_snapping_search_window(self):
+        """DelineateIt: snapping searches snap_distance pixels each way."""
+        from natcap.invest.delineateit import delineateit
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        wkt = srs.ExportToWkt()
+
+        stream_matrix = numpy.array(
+            [[0, 0, 0, 0, 0, 0, 1],
+             [0, 0, 0, 0, 0, 0, 0],
+             [0, 0, 0, 0, 0, 0, 0],
+             [0, 0, 0, 0, 0, 0, 0]], dtype=numpy.int8)
+        stream_raster_path = os.path.join(self.workspace_dir, 'streams.tif')
+        flow_accum_path = os.path.join(self.workspace_dir, 'flow_accum.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, stream_raster_path)
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, flow_accum_path)
+
+        source_points_path = os.path.join(self.workspace_dir,
+                                          'source_features.geojson')
+        source_features = [
+            Point(9, -3),  # exactly 3 pixels left of the stream pixel
+            Point(3, -3),  # 6 pixels left of the stream pixel
+            Point(15, -9),  # exactly 3 pixels below the stream pixel
+        ]
+        pygeoprocessing.shapely_geometry_to_vector(
+            source_features, source_points_path, wkt, 'GeoJSON',
+            ogr_geom_type=ogr.wkbUnknown)
+
+        snapped_points_path = os.path.join(self.workspace_dir,
+                                           'snapped_points.gpkg')
+        delineateit.snap_points_to_nearest_stream(
+            source_points_path, stream_raster_path, flow_accum_path,
+            3, snapped_points_path)
+
+        snapped_points_vector = gdal.OpenEx(snapped_points_path,
+                                            gdal.OF_VECTOR)
+        snapped_points_layer = snapped_points_vector.GetLayer()
+        points = [
+            shapely.wkb.loads(bytes(feature.GetGeometryRef().ExportToWkb()))
+            for feature in snapped_points_layer]
+        self.assertEqual(
+            [(point.x, point.y) for point in points],
+            [(15, -3), (3, -3), (15, -3)])
+
+    def test_point_snapping_raster_edges(self):
+        """DelineateIt: points just past the last row or column are skipped."""
+        from natcap.invest.delineateit import delineateit
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        wkt = srs.ExportToWkt()
+
+        stream_matrix = numpy.array(
+            [[0, 1, 0, 0, 0, 0],
+             [0, 1, 0, 0, 0, 0],
+             [0, 1, 0, 0, 0, 0],
+             [0, 1, 0, 0, 0, 0],
+             [0, 1, 1, 1, 1, 1],
+             [0, 1, 0, 0, 0, 0],
+             [0, 1, 0, 0, 0, 0]], dtype=numpy.int8)
+        stream_raster_path = os.path.join(self.workspace_dir, 'streams.tif')
+        flow_accum_path = os.path.join(self.workspace_dir, 'flow_accum.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, stream_raster_path)
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, flow_accum_path)
+
+        # The raster covers x from 2 to 14 and y from -2 to -16.
+        source_points_path = os.path.join(self.workspace_dir,
+                                          'source_features.geojson')
+        source_features = [
+            Point(14.5, -5),  # one column past the last column
+            Point(3, -16.5),  # one row past the last row
+            Point(13.9, -15.9),  # in the last row and column
+        ]
+        pygeoprocessing.shapely_geometry_to_vector(
+            source_features, source_points_path, wkt, 'GeoJSON',
+            ogr_geom_type=ogr.wkbUnknown)
+
+        snapped_points_path = os.path.join(self.workspace_dir,
+                                           'snapped_points.gpkg')
+        logger = logging.getLogger('natcap.invest.delineateit.delineateit')
+        with capture_logging(logger, logging.WARNING) as log_records:
+            delineateit.snap_points_to_nearest_stream(
+                source_points_path, stream_raster_path, flow_accum_path,
+                3, snapped_points_path)
+        self.assertEqual(len(log_records), 2)
+        for record in log_records:
+            self.assertIn('outside the bounds', record.msg)
+
+        snapped_points_vector = gdal.OpenEx(snapped_points_path,
+                                            gdal.OF_VECTOR)
+        snapped_points_layer = snapped_points_vector.GetLayer()
+        points = [
+            shapely.wkb.loads(bytes(feature.GetGeometryRef().ExportToWkb()))
+            for feature in snapped_points_layer]
+        self.assertEqual([(point.x, point.y) for point in points],
+                         [(13, -11)])
+
+    def test_point_snapping_spatial_index(self):
+        """DelineateIt: snapped points get a spatial index despite quotes."""
+        from natcap.invest.delineateit import delineateit
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        wkt = srs.ExportToWkt()
+
+        stream_matrix = numpy.array(
+            [[0, 1, 0],
+             [0, 1, 0],
+             [0, 1, 0]], dtype=numpy.int8)
+        stream_raster_path = os.path.join(self.workspace_dir, 'streams.tif')
+        flow_accum_path = os.path.join(self.workspace_dir, 'flow_accum.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, stream_raster_path)
+        pygeoprocessing.numpy_array_to_raster(
+            stream_matrix, 255, (2, -2), (2, -2), wkt, flow_accum_path)
+
+        source_points_path = os.path.join(self.workspace_dir,
+                                          'source_features.geojson')
+        pygeoprocessing.shapely_geometry_to_vector(
+            [Point(3, -5), Point(7, -7)], source_points_path, wkt, 'GeoJSON',
+            ogr_geom_type=ogr.wkbPoint)
+
+        # the layer name comes from the filename, and is quoted in the SQL
+        # that creates the spatial index
+        snapped_points_path = os.path.join(self.workspace_dir,
+                                           "snapped_o'points.gpkg")
+        logger = logging.getLogger('natcap.invest.delineateit.delineateit')
+        with capture_logging(logger, logging.WARNING) as log_records:
+            delineateit.snap_points_to_nearest_stream(
+                source_points_path, stream_raster_path, flow_accum_path,
+                3, snapped_points_path)
+        self.assertEqual(log_records, [])
+
+        snapped_points_vector = gdal.OpenEx(snapped_points_path,
+                                            gdal.OF_VECTOR)
+        snapped_points_layer = snapped_points_vector.GetLayer()
+        self.assertEqual(snapped_points_layer.GetName(), "snapped_o'points")
+        self.assertEqual(snapped_points_layer.GetFeatureCount(), 2)
+        result = snapped_points_vector.ExecuteSQL(
+            "SELECT HasSpatialIndex('snapped_o''points', '{}')".format(
+                snapped_points_layer.GetGeometryColumn()))
+        self.assertEqual(result.GetNextFeature().GetField(0), 1)
+        snapped_points_vector.ReleaseResultSet(result)
+
     def test_preprocess_geometries(self):
         """DelineateIt: Check that we can reasonably repair geometries."""
         from natcap.invest.delineateit import delineateit
@@ -686,6 +836,102 @@ class DelineateItTests(unittest.TestCase):
             output,
             expected_pour_points))
 
+    def test_find_nearest_stream_pixels(self):
+        """DelineateIt: search outwards for the nearest stream pixels."""
+        from natcap.invest.delineateit import delineateit_core
+
+        stream_mask = numpy.array([
+            [0, 0, 0, 1],
+            [1, 0, 0, 0],
+            [0, 0, 0, 0],
+            [0, 0, 1, 0]], dtype=numpy.uint8)
+
+        # offsets within 2 pixels of the center, nearest first
+        row_offsets, col_offsets = numpy.mgrid[-2:3, -2:3].reshape(
+            2, -1).astype(numpy.intc)
+        squared_distances = row_offsets**2 + col_offsets**2
+        order = numpy.lexsort((col_offsets, row_offsets, squared_distances))
+
+        def find(row, col):
+            return delineateit_core.find_nearest_stream_pixels(
+                stream_mask, row, col, row_offsets[order],
+                col_offsets[order], squared_distances[order])
+
+        # (1, 0) and (3, 2) are both sqrt(2) away from (2, 1)
+        self.assertEqual(find(2, 1), [(1, 0), (3, 2)])
+        self.assertEqual(find(3, 2), [(3, 2)])
+        self.assertEqual(find(0, 1), [(1, 0)])
+        # search area is partly off the edge of the array
+        self.assertEqual(find(0, 3), [(0, 3)])
+        # no stream pixels within 2 rows and columns
+        stream_mask[:] = 0
+        stream_mask[0, 3] = 1
+        self.assertEqual(find(3, 0), [])
+
+    def test_read_stream_window(self):
+        """DelineateIt: assemble stream windows from cached blocks."""
+        from natcap.invest.delineateit import delineateit
+
+        stream_array = numpy.random.default_rng(0).integers(
+            0, 2, (40, 50), dtype=numpy.uint8)
+        stream_array[::7, ::5] = 255  # nodata is not a stream
+        stream_raster_path = os.path.join(self.workspace_dir, 'streams.tif')
+        driver = gdal.GetDriverByName('GTiff')
+        raster = driver.Create(
+            stream_raster_path, 50, 40, 1, gdal.GDT_Byte,
+            options=['TILED=YES', 'BLOCKXSIZE=16', 'BLOCKYSIZE=16'])
+        band = raster.GetRasterBand(1)
+        band.SetNoDataValue(255)
+        band.WriteArray(stream_array)
+        band = None
+        raster = None
+
+        raster = gdal.OpenEx(stream_raster_path, gdal.OF_RASTER)
+        band = raster.GetRasterBand(1)
+        block_cache = collections.OrderedDict()
+        for x_left, y_top, x_right, y_bottom in [
+                (0, 0, 50, 40),  # the whole raster
+                (10, 12, 20, 35),  # crosses block boundaries
+                (48, 30, 50, 40),  # partial blocks on the edge
+                (16, 16, 32, 32)]:  # exactly one block
+            window = delineateit._read_stream_window(
+                band, block_cache, 2, x_left, y_top, x_right, y_bottom)
+            numpy.testing.assert_array_equal(
+                window, stream_array[y_top:y_bottom, x_left:x_right] == 1)
+            self.assertLessEqual(len(block_cache), 2)
+
+    def test_threshold_streams(self):
+        """DelineateIt: threshold flow accumulation into streams."""
+        from natcap.invest.delineateit import delineateit
+
+        n = -1  # nodata value
+        flow_accum_array = numpy.array([
+            [1, 5, 6, n],
+            [n, 5, 100, 0]], dtype=numpy.float64)
+
+        expected_array = numpy.array([
+            [0, 0, 1, 255],
+            [255, 0, 1, 0]], dtype=numpy.uint8)
+        numpy.testing.assert_array_equal(
+            delineateit._threshold_streams(flow_accum_array, n, 255, 5),
+            expected_array)
+
+        # Without a nodata value, every pixel is classified.
+        expected_array = numpy.array([
+            [0, 0, 1, 0],
+            [0, 0, 1, 0]], dtype=numpy.uint8)
+        numpy.testing.assert_array_equal(
+            delineateit._threshold_streams(flow_accum_array, None, 255, 5),
+            expected_array)
+
+        # Nodata is matched exactly in the array's own precision, and values
+        # that are merely close to nodata are still valid.
+        flow_accum_array = numpy.array(
+            [[0.1, 0.1000001, 6]], dtype=numpy.float32)
+        numpy.testing.assert_array_equal(
+            delineateit._threshold_streams(flow_accum_array, 0.1, 255, 5),
+            numpy.array([[255, 0, 1]], dtype=numpy.uint8))
+
     def test_find_pour_points_by_block(self):
         """DelineateIt: test pour point detection against block edges."""
         from natcap.invest.delineateit import delineateit
@@ -7,7 +7,7 @@ import unittest
 from unittest import mock
 
 import numpy
-from osgeo import gdal, osr
+from osgeo import gdal, ogr, osr
 import pandas
 import pygeoprocessing
 from pygeoprocessing.geoprocessing_core import (
@@ -436,6 +436,94 @@ class StormwaterTests(unittest.TestCase):
         numpy.testing.assert_allclose(actual_runoff_volume,
                                       expected_runoff_volume, rtol=1e-6)
 
+    def test_adjust_nothing_to_be_near(self):
+        """Stormwater: adjust ratios with no connected LULC or no roads."""
+        from natcap.invest import stormwater
+
+        for case in ['no_connected_lulc', 'no_roads']:
+            with self.subTest(case=case):
+                workspace_dir = os.path.join(self.workspace_dir, case)
+                os.makedirs(workspace_dir)
+                (biophysical_table,
+                 biophysical_table_path, _,
+                 lulc_path, _,
+                 soil_group_path, _,
+                 precipitation_path,
+                 retention_cost, _) = self.basic_setup(workspace_dir)
+
+                if case == 'no_connected_lulc':
+                    biophysical_table['is_connected'] = 0
+                    biophysical_table.to_csv(biophysical_table_path)
+                    centerlines_path = os.path.join(
+                        TEST_DATA, 'centerlines.gpkg')
+                    skipped_paths = [
+                        'connected_lulc_path',
+                        'connected_lulc_distance_path',
+                        'near_connected_lulc_path']
+                else:
+                    centerlines_path = os.path.join(
+                        workspace_dir, 'centerlines.gpkg')
+                    srs = osr.SpatialReference()
+                    srs.ImportFromEPSG(3857)
+                    pygeoprocessing.shapely_geometry_to_vector(
+                        [], centerlines_path, srs.ExportToWkt(), 'GPKG',
+                        ogr_geom_type=ogr.wkbLineString)
+                    skipped_paths = [
+                        'rasterized_centerlines_path',
+                        'road_distance_path',
+                        'near_road_path']
+
+                args = {
+                    'workspace_dir': workspace_dir,
+                    'lulc_path': lulc_path,
+                    'soil_group_path': soil_group_path,
+                    'precipitation_path': precipitation_path,
+                    'biophysical_table': biophysical_table_path,
+                    'adjust_retention_ratios': True,
+                    'retention_radius': 30,
+                    'road_centerlines_path': centerlines_path,
+                    'aggregate_areas_path': None,
+                    'replacement_cost': retention_cost
+                }
+                stormwater.execute(args)
+
+                intermediate_dir = os.path.join(workspace_dir, 'intermediate')
+                for key in skipped_paths:
+                    self.assertFalse(os.path.exists(os.path.join(
+                        intermediate_dir,
+                        stormwater.INTERMEDIATE_OUTPUTS[key])))
+
+                # the adjusted ratios should be the same as if the skipped
+                # near raster had been calculated and was all zeros
+                near_arrays = {}
+                for key in ['near_connected_lulc_path', 'near_road_path']:
+                    if key in skipped_paths:
+                        near_arrays[key] = numpy.zeros((4, 4), numpy.uint8)
+                    else:
+                        near_arrays[key] = (
+                            pygeoprocessing.raster_to_numpy_array(
+                                os.path.join(
+                                    intermediate_dir,
+                                    stormwater.INTERMEDIATE_OUTPUTS[key])))
+                expected_adjusted_ratios = stormwater.adjust_op(
+                    pygeoprocessing.raster_to_numpy_array(os.path.join(
+                        workspace_dir,
+                        stormwater.FINAL_OUTPUTS['retention_ratio_path'])),
+                    pygeoprocessing.raster_to_numpy_array(os.path.join(
+                        intermediate_dir,
+                        stormwater.INTERMEDIATE_OUTPUTS[
+                            'ratio_average_path'])),
+                    near_arrays['near_connected_lulc_path'],
+                    near_arrays['near_road_path'])
+                actual_adjusted_ratios = (
+                    pygeoprocessing.raster_to_numpy_array(os.path.join(
+                        workspace_dir,
+                        stormwater.FINAL_OUTPUTS[
+                            'adjusted_retention_ratio_path'])))
+                numpy.testing.assert_allclose(
+                    actual_adjusted_ratios, expected_adjusted_ratios,
+                    rtol=1e-6)
+
     def test_aggregate(self):
         """Stormwater: full model run with aggregate results."""
         from natcap.invest import stormwater
@@ -540,11 +628,91 @@ class StormwaterTests(unittest.TestCase):
             lulc_path,
             soil_group_path,
             ratio_array,
-            sorted_lucodes,
+            stormwater.make_lucode_lookup(sorted_lucodes),
             output_path)
         actual_output = pygeoprocessing.raster_to_numpy_array(output_path)
         numpy.testing.assert_allclose(expected_output, actual_output)
 
+    def test_lookup_ratios_invalid_soil_group(self):
+        """Stormwater: test lookup_ratios with an out-of-range soil group."""
+        from natcap.invest import stormwater
+
+        sorted_lucodes = [10, 11]
+        lulc_array = numpy.array([[10, 11, 10]], dtype=numpy.uint8)
+        lulc_path = os.path.join(self.workspace_dir, 'lulc.tif')
+        soil_group_path = os.path.join(self.workspace_dir, 'soil_groups.tif')
+        output_path = os.path.join(self.workspace_dir, 'out.tif')
+        to_raster(lulc_array, lulc_path, nodata=255)
+        ratio_array = numpy.array([
+            [0.11, 0.12, 0.13, 0.14],
+            [0.21, 0.22, 0.23, 0.24]], dtype=numpy.float32)
+
+        # soil groups past D would otherwise pick up the next LULC row's
+        # ratios, negative ones the previous row's, and 0 the placeholder
+        for soil_groups, invalid in [
+                ([1, 5, 6], [5, 6]), ([1, -1, 2], [-1]), ([0, 4, 2], [0])]:
+            to_raster(numpy.array([soil_groups], dtype=numpy.int16),
+                      soil_group_path, nodata=-9999)
+            with self.assertRaises(ValueError) as cm:
+                stormwater.lookup_ratios(
+                    lulc_path,
+                    soil_group_path,
+                    ratio_array,
+                    stormwater.make_lucode_lookup(sorted_lucodes),
+                    output_path)
+            self.assertIn(str(invalid), str(cm.exception))
+
+    def test_calculate_volume_products(self):
+        """Stormwater: test calculate_volume_products function."""
+        from natcap.invest import stormwater
+
+        sorted_lucodes = [1, 2]
+        ratio_array = numpy.array([
+            [0.5, 1, stormwater.FLOAT_NODATA],
+            [0,   1, 0.25]], dtype=numpy.float32)
+        precip_array = numpy.array([
+            [10, 20, 30],
+            [40, 50, -2]], dtype=numpy.float32)
+        lulc_array = numpy.array([
+            [1, 2, 1],
+            [2, 255, 1]], dtype=numpy.uint8)
+        emc_arrays = [
+            numpy.array([1, 2], dtype=numpy.float32),
+            numpy.array([0.5, 4], dtype=numpy.float32)]
+        ratio_path = os.path.join(self.workspace_dir, 'ratio.tif')
+        precip_path = os.path.join(self.workspace_dir, 'precip.tif')
+        lulc_path = os.path.join(self.workspace_dir, 'lulc.tif')
+        volume_path = os.path.join(self.workspace_dir, 'volume.tif')
+        load_paths = [
+            os.path.join(self.workspace_dir, f'load_{i}.tif') for i in [0, 1]]
+        value_path = os.path.join(self.workspace_dir, 'value.tif')
+        to_raster(ratio_array, ratio_path, nodata=stormwater.FLOAT_NODATA)
+        to_raster(precip_array, precip_path, nodata=-2)
+        to_raster(lulc_array, lulc_path, nodata=255)
+        pixel_area = 400  # default pixel size is 20 x 20
+
+        stormwater.calculate_volume_products(
+            ratio_path, precip_path, lulc_path, pixel_area,
+            stormwater.make_lucode_lookup(sorted_lucodes), volume_path,
+            emc_arrays=emc_arrays, load_paths=load_paths,
+            replacement_cost=1.5, value_path=value_path)
+
+        expected_volume = stormwater.volume_op(
+            ratio_array, precip_array, -2, pixel_area)
+        numpy.testing.assert_allclose(
+            pygeoprocessing.raster_to_numpy_array(volume_path),
+            expected_volume)
+        for emc_array, load_path in zip(emc_arrays, load_paths):
+            numpy.testing.assert_allclose(
+                pygeoprocessing.raster_to_numpy_array(load_path),
+                stormwater.pollutant_load_op(
+                    lulc_array, 255, expected_volume,
+                    stormwater.make_lucode_lookup(sorted_lucodes),
+                    emc_array))
+        numpy.testing.assert_allclose(
+            pygeoprocessing.raster_to_numpy_array(value_path),
+            stormwater.retention_value_op(expected_volume, 1.5))
+
     def test_volume_op(self):
         """Stormwater: test volume_op function."""
         from natcap.invest import stormwater
@@ -599,7 +767,7 @@ class StormwaterTests(unittest.TestCase):
                     lulc_array,
                     lulc_nodata,
                     retention_volume_array,
-                    sorted_lucodes,
+                    stormwater.make_lucode_lookup(sorted_lucodes),
                     emc_array)
                 for y in range(lulc_array.shape[0]):
                     for x in range(lulc_array.shape[1]):
@@ -613,6 +781,55 @@ class StormwaterTests(unittest.TestCase):
                                 retention_volume_array[y, x] / 1000
                             numpy.testing.assert_allclose(out[y, x], expected)
 
+    def test_lucodes_to_indexes(self):
+        """Stormwater: test looking up LULC codes' indexes."""
+        from natcap.invest import stormwater
+
+        lucode_lookup = stormwater.make_lucode_lookup([2, 5, 9])
+        numpy.testing.assert_equal(
+            stormwater.lucodes_to_indexes(
+                numpy.array([[9, 2], [5, 5]], dtype=numpy.uint8),
+                lucode_lookup),
+            numpy.array([[2, 0], [1, 1]]))
+
+        # codes between, below and above the codes in the table
+        for lulc_array in [[3], [1], [10]]:
+            with self.subTest(lulc_array=lulc_array):
+                with self.assertRaises(ValueError) as cm:
+                    stormwater.lucodes_to_indexes(
+                        numpy.array(lulc_array), lucode_lookup)
+                self.assertIn(str(lulc_array), str(cm.exception))
+
+        # codes too spread out to make a lookup array for
+        lucode_lookup = stormwater.make_lucode_lookup([-5, 2, 2**31])
+        self.assertIsNone(lucode_lookup[0])
+        numpy.testing.assert_equal(
+            stormwater.lucodes_to_indexes(
+                numpy.array([[2**31, 2], [-5, 2]], dtype=numpy.int64),
+                lucode_lookup),
+            numpy.array([[2, 1], [0, 1]]))
+        with self.assertRaises(ValueError) as cm:
+            stormwater.lucodes_to_indexes(
+                numpy.array([3, 2**32]), lucode_lookup)
+        self.assertIn(str([3, 2**32]), str(cm.exception))
+
+    def test_connected_lulc_op(self):
+        """Stormwater: test connected_lulc_op function."""
+        from natcap.invest import stormwater
+
+        lulc_nodata = -1
+        lulc_array = numpy.array([
+            [2, 5, -1],
+            [9, 9, 2]], dtype=numpy.int16)
+        is_connected_array = numpy.array([1, 0, 1], dtype=numpy.uint8)
+        expected = numpy.array([
+            [1, 0, stormwater.UINT8_NODATA],
+            [1, 1, 1]], dtype=numpy.uint8)
+        actual = stormwater.connected_lulc_op(
+            lulc_array, lulc_nodata, stormwater.make_lucode_lookup([2, 5, 9]),
+            is_connected_array)
+        numpy.testing.assert_equal(actual, expected)
+
     def test_retention_value_op(self):
         """Stormwater: test retention_value_op function."""
         from natcap.invest import stormwater
@@ -673,6 +890,14 @@ class StormwaterTests(unittest.TestCase):
                     numpy.testing.assert_allclose(out[y, x], adjusted,
                                                   rtol=1e-6)
 
+        # 0 in place of a near array is the same as an array of all 0s
+        numpy.testing.assert_allclose(
+            stormwater.adjust_op(
+                ratio_array, avg_ratio_array, near_connected_lulc_array, 0),
+            stormwater.adjust_op(
+                ratio_array, avg_ratio_array, near_connected_lulc_array,
+                numpy.zeros(ratio_array.shape, dtype=numpy.uint8)))
+
     def test_is_near(self):
         """Stormwater: test is_near function."""
         from natcap.invest import stormwater
@@ -850,3 +1075,46 @@ class StormwaterTests(unittest.TestCase):
         distance_is_zero = pygeoprocessing.raster_to_numpy_array(
             road_distance_path) == 0
         self.assertFalse(numpy.all(distance_is_zero))
+
+    def test_biophysical_table_missing_values(self):
+        """Stormwater: error on missing values in the biophysical table."""
+        from natcap.invest import stormwater
+
+        (biophysical_table,
+         biophysical_table_path, _,
+         lulc_path, _,
+         soil_group_path, _,
+         precipitation_path,
+         retention_cost, _) = self.basic_setup(self.workspace_dir)
+
+        args = {
+            'workspace_dir': self.workspace_dir,
+            'lulc_path': lulc_path,
+            'soil_group_path': soil_group_path,
+            'precipitation_path': precipitation_path,
+            'biophysical_table': biophysical_table_path,
+            'adjust_retention_ratios': False,
+            'retention_radius': None,
+            'road_centerlines_path': None,
+            'aggregate_areas_path': None,
+            'replacement_cost': retention_cost
+        }
+
+        for column in ['RC_B', 'EMC_pollutant1']:
+            with self.subTest(column=column):
+                table = biophysical_table.copy()
+                table.loc[11, column] = numpy.nan
+                table.to_csv(biophysical_table_path)
+                with self.assertRaises(ValueError) as cm:
+                    stormwater.execute(args)
+                self.assertIn(column.lower(), str(cm.exception))
+                self.assertIn('[11]', str(cm.exception))
+
+        # a row with no lucode is reported by its line number
+        table = biophysical_table.reset_index()
+        table.loc[2, 'lucode'] = numpy.nan
+        table.to_csv(biophysical_table_path, index=False)
+        with self.assertRaises(ValueError) as cm:
+            stormwater.execute(args)
+        self.assertIn('lucode', str(cm.exception))
+        self.assertIn('[4]', str(cm.exception))